@@ -0,0 +1,136 @@
+import json
+import os
+import subprocess
+
+import numpy as np
+
+# Loudness envelope of a source's audio, decoded once and kept next to the
+# source as <file>.loudness.npy (mean square per 10 ms) + <file>.loudness.json
+ENVELOPE_SAMPLE_RATE = 16000
+ENVELOPE_HOP = 0.01             # seconds per stored bucket
+ENVELOPE_BLOCK_BUCKETS = 3000   # buckets decoded per pipe read (30 s)
+ENVELOPE_VERSION = 1
+
+
+def sidecar_paths(video_file):
+    """Paths of the envelope array and its metadata next to video_file."""
+    return video_file + '.loudness.npy', video_file + '.loudness.json'
+
+
+def envelope_key(video_file):
+    """Identity of the source and the analysis settings the sidecar was built with."""
+    st = os.stat(video_file)
+    return {
+        'path': os.path.abspath(video_file),
+        'size': st.st_size,
+        'mtime_ns': st.st_mtime_ns,
+        'sample_rate': ENVELOPE_SAMPLE_RATE,
+        'hop': ENVELOPE_HOP,
+        'version': ENVELOPE_VERSION,
+    }
+
+
+def decode_mean_square(video_file, sample_rate=ENVELOPE_SAMPLE_RATE, hop=ENVELOPE_HOP,
+                       block_buckets=ENVELOPE_BLOCK_BUCKETS):
+    """
+    Mean square of every complete `hop` bucket of video_file's audio, plus the
+    sum of squares and sample count of the whole track. ffmpeg decodes mono
+    float32 into one reused block buffer, so memory stays flat however long
+    the source is. Raises CalledProcessError if ffmpeg fails.
+    """
+    bucket_size = int(round(hop * sample_rate))
+    block = np.empty(bucket_size * block_buckets, dtype=np.float32)
+    view = memoryview(block).cast('B')
+    cmd = [
+        'ffmpeg', '-v', 'error', '-i', video_file,
+        '-vn', '-ac', '1', '-ar', str(sample_rate),
+        '-f', 'f32le', 'pipe:1'
+    ]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    levels = []
+    total_square = 0.0
+    total_samples = 0
+    try:
+        while True:
+            filled = 0
+            while filled < len(view):
+                n = proc.stdout.readinto(view[filled:])
+                if not n:
+                    break
+                filled += n
+            samples = block[:filled // 4]
+            if not len(samples):
+                break
+            total_square += float(np.dot(samples, samples))
+            total_samples += len(samples)
+            num_buckets = len(samples) // bucket_size
+            if num_buckets:
+                buckets = samples[:num_buckets * bucket_size].reshape(num_buckets, bucket_size)
+                levels.append(np.square(buckets).mean(axis=1, dtype=np.float64).astype(np.float32))
+            if filled < len(view):
+                break
+        stderr = proc.stderr.read()
+        if proc.wait() != 0:
+            raise subprocess.CalledProcessError(proc.returncode, cmd, stderr=stderr)
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        proc.stdout.close()
+        proc.stderr.close()
+
+    mean_square = np.concatenate(levels) if levels else np.zeros(0, dtype=np.float32)
+    return mean_square, total_square, total_samples
+
+
+def load_envelope(video_file):
+    """
+    Return (mean_square, meta) for video_file, memory-mapped from its sidecar.
+    The sidecar is (re)built when missing or when the source's path, size or
+    mtime no longer match.
+    """
+    npy_path, meta_path = sidecar_paths(video_file)
+    key = envelope_key(video_file)
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('key') == key:
+            return np.load(npy_path, mmap_mode='r'), meta
+    except (OSError, ValueError):
+        pass
+
+    mean_square, total_square, total_samples = decode_mean_square(video_file)
+    meta = {'key': key, 'total_square': total_square, 'total_samples': total_samples}
+    try:
+        # Array first: the metadata file marks the sidecar as complete
+        with open(npy_path + '.tmp', 'wb') as f:
+            np.save(f, mean_square)
+        os.replace(npy_path + '.tmp', npy_path)
+        with open(meta_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(meta_path + '.tmp', meta_path)
+    except OSError as e:
+        print(f"Could not store loudness envelope for {video_file}: {e}")
+        return mean_square, meta
+    print(f"Stored loudness envelope: {npy_path} ({len(mean_square)} buckets)")
+    return np.load(npy_path, mmap_mode='r'), meta
+
+
+def rms_envelope(video_file, bucket=ENVELOPE_HOP, duration=None):
+    """
+    Return (levels, global_rms, bucket): the RMS of every complete bucket of
+    video_file's audio, the global RMS of the track, and the bucket length
+    actually used, which is `bucket` rounded to whole ENVELOPE_HOP buckets
+    (e.g. 0.125 -> 0.12). Time levels with the returned bucket. With
+    duration, only the first `duration` seconds are returned.
+    """
+    mean_square, meta = load_envelope(video_file)
+    factor = max(1, int(round(bucket / ENVELOPE_HOP)))
+    if duration is not None:
+        mean_square = mean_square[:int(round(duration / ENVELOPE_HOP))]
+    n = len(mean_square) // factor
+    grouped = np.asarray(mean_square[:n * factor], dtype=np.float64).reshape(n, factor)
+    levels = np.sqrt(grouped.mean(axis=1))
+    total_samples = meta['total_samples']
+    global_rms = np.sqrt(meta['total_square'] / total_samples) if total_samples else 0.0
+    return levels, global_rms, factor * ENVELOPE_HOP
@@ -0,0 +1,522 @@
+import bisect
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from moviepy import TextClip, ImageClip, CompositeVideoClip
+
+FONT_PATH = "Raleway-BoldItalic.ttf"
+RASTER_CACHE_SIZE = 4096   # distinct word rasters kept in memory
+TEXT_MARGIN = 5            # transparent rows above and below each word raster
+# "textclip": render each new word with TextClip, "atlas": assemble it from
+# a glyph atlas rendered once per style
+TEXT_BACKEND = "textclip"
+
+
+# Process-wide LRU of rasterized words. Entries are (rgb, mask) arrays shared
+# by every clip that shows the same word, so common words such as "the" are
+# rasterized once per style instead of once per occurrence.
+_RASTER_CACHE = OrderedDict()
+RASTER_STATS = {'hits': 0, 'misses': 0}
+
+
+def get_word_raster(text, font=FONT_PATH, font_size=54, color="white",
+                    stroke_color="black", stroke_width=1, scale=1.0, cache=True):
+    """
+    Return the (rgb uint8, mask float) arrays for a caption word, rendering
+    it (with TextClip or the glyph atlas, per TEXT_BACKEND) only on a cache miss.
+    With cache=False a freshly rendered raster is not added to the cache.
+    """
+    key = (text, font, font_size, color, stroke_color, stroke_width, scale)
+    raster = _RASTER_CACHE.get(key)
+    if raster is not None:
+        _RASTER_CACHE.move_to_end(key)
+        RASTER_STATS['hits'] += 1
+        return raster
+
+    RASTER_STATS['misses'] += 1
+    if TEXT_BACKEND == "atlas":
+        raster = render_word_from_atlas(text, font, font_size, color, stroke_color, stroke_width)
+        if scale != 1.0:
+            raster = scale_raster(raster, scale)
+    else:
+        txt = TextClip(
+            text=text,
+            font=font,
+            font_size=font_size,
+            color=color,
+            stroke_color=stroke_color,
+            stroke_width=stroke_width,
+            margin=(0, TEXT_MARGIN),
+        )
+        if scale != 1.0:
+            txt = txt.resized(scale)
+        raster = (
+            np.asarray(txt.get_frame(0), dtype=np.uint8),
+            np.asarray(txt.mask.get_frame(0), dtype=np.float32),
+        )
+        txt.close()
+
+    if cache:
+        _RASTER_CACHE[key] = raster
+        if len(_RASTER_CACHE) > RASTER_CACHE_SIZE:
+            _RASTER_CACHE.popitem(last=False)
+    return raster
+
+
+# Font metrics for layout: fonts are opened once per (path, size) and each
+# glyph's advance width is measured once, so words are laid out without
+# rasterizing them.
+_FONTS = {}
+_GLYPH_ADVANCES = {}
+
+
+def get_font(font=FONT_PATH, font_size=54):
+    """Return the shared Pillow FreeType font for (font, font_size)."""
+    key = (font, font_size)
+    pil_font = _FONTS.get(key)
+    if pil_font is None:
+        pil_font = _FONTS[key] = ImageFont.truetype(font, font_size)
+    return pil_font
+
+
+def measure_word(text, font=FONT_PATH, font_size=54, stroke_width=1):
+    """
+    Width in pixels of a caption word from cached glyph advance widths,
+    matching the width of its TextClip raster closely enough for layout.
+    """
+    width = sum(glyph_advance(ch, font, font_size) for ch in text)
+    return int(np.ceil(width)) + 2 * stroke_width if text else 0
+
+
+def glyph_advance(ch, font=FONT_PATH, font_size=54):
+    """Cached advance width of one glyph."""
+    key = (font, font_size, ch)
+    advance = _GLYPH_ADVANCES.get(key)
+    if advance is None:
+        advance = _GLYPH_ADVANCES[key] = get_font(font, font_size).getlength(ch)
+    return advance
+
+
+ATLAS_CHARS = "".join(chr(c) for c in range(32, 127))
+
+
+# Glyph atlases, one per (font, size, color, stroke colour, stroke width).
+# Each holds premultiplied glyph cells that words are assembled from; glyphs
+# outside ATLAS_CHARS are rendered on first use and added to the atlas.
+_GLYPH_ATLASES = {}
+
+
+def _render_glyph_cells(chars, pil_font, color, stroke_color, stroke_width):
+    """
+    Render chars side by side into one RGBA strip. Returns the premultiplied
+    (rgb, alpha) strip and {char: (x0, x1, left)} cell bounds, where left is
+    the glyph's offset from the pen position.
+    """
+    ascent, descent = pil_font.getmetrics()
+    height = ascent + descent + 2 * stroke_width
+    boxes = [pil_font.getbbox(ch, anchor='ls', stroke_width=stroke_width) for ch in chars]
+    widths = [max(box[2] - box[0], 0) for box in boxes]
+
+    strip = Image.new("RGBA", (max(sum(widths), 1), height), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(strip)
+    cells = {}
+    x = 0
+    for ch, box, w in zip(chars, boxes, widths):
+        if w:
+            draw.text((x - box[0], ascent + stroke_width), ch, font=pil_font, fill=color,
+                      stroke_width=stroke_width, stroke_fill=stroke_color, anchor='ls')
+        cells[ch] = (x, x + w, box[0])
+        x += w
+
+    rgba = np.asarray(strip, dtype=np.float32) / 255.0
+    alpha = rgba[:, :, 3:4]
+    return rgba[:, :, :3] * 255.0 * alpha, alpha, cells
+
+
+def get_glyph_atlas(font=FONT_PATH, font_size=54, color="white",
+                    stroke_color="black", stroke_width=1):
+    """Return the glyph atlas for a text style, rendering it on first use."""
+    key = (font, font_size, color, stroke_color, stroke_width)
+    atlas = _GLYPH_ATLASES.get(key)
+    if atlas is None:
+        pil_font = get_font(font, font_size)
+        rgb, alpha, cells = _render_glyph_cells(ATLAS_CHARS, pil_font, color,
+                                                stroke_color, stroke_width)
+        atlas = _GLYPH_ATLASES[key] = {
+            'height': rgb.shape[0],
+            'glyphs': {ch: (rgb[:, x0:x1], alpha[:, x0:x1], left)
+                       for ch, (x0, x1, left) in cells.items()},
+            'style': (pil_font, color, stroke_color, stroke_width),
+        }
+    return atlas
+
+
+def _atlas_glyph(atlas, ch):
+    """(rgb, alpha, left) cell for ch, adding it to the atlas if unseen."""
+    glyph = atlas['glyphs'].get(ch)
+    if glyph is None:
+        rgb, alpha, cells = _render_glyph_cells(ch, *atlas['style'])
+        x0, x1, left = cells[ch]
+        glyph = atlas['glyphs'][ch] = (rgb[:, x0:x1], alpha[:, x0:x1], left)
+    return glyph
+
+
+def render_word_from_atlas(text, font=FONT_PATH, font_size=54, color="white",
+                           stroke_color="black", stroke_width=1):
+    """
+    Assemble a word's (rgb uint8, mask float) raster from glyph atlas slices
+    with NumPy, laid out at the font's advance widths.
+    """
+    atlas = get_glyph_atlas(font, font_size, color, stroke_color, stroke_width)
+    placed = []
+    pen = 0.0
+    for ch in text:
+        glyph = _atlas_glyph(atlas, ch)
+        placed.append((pen + glyph[2], glyph))
+        pen += glyph_advance(ch, font, font_size)
+
+    x_min = min([x for x, _ in placed] + [0.0])
+    width = int(np.ceil(max([x + g[0].shape[1] for x, g in placed] + [pen]) - x_min))
+    height = atlas['height'] + 2 * TEXT_MARGIN
+    word_rgb = np.zeros((height, max(width, 1), 3), dtype=np.float32)
+    word_alpha = np.zeros((height, max(width, 1), 1), dtype=np.float32)
+    for x, (glyph_rgb, glyph_alpha, _) in placed:
+        x = int(round(x - x_min))
+        w = min(glyph_rgb.shape[1], word_rgb.shape[1] - x)
+        rows = slice(TEXT_MARGIN, TEXT_MARGIN + atlas['height'])
+        a = glyph_alpha[:, :w]
+        # Premultiplied "over", so overlapping italic glyphs join cleanly
+        word_rgb[rows, x:x + w] = glyph_rgb[:, :w] + word_rgb[rows, x:x + w] * (1 - a)
+        word_alpha[rows, x:x + w] = a + word_alpha[rows, x:x + w] * (1 - a)
+
+    straight = word_rgb / np.maximum(word_alpha, 1e-6)
+    return (np.clip(np.rint(straight), 0, 255).astype(np.uint8),
+            word_alpha[:, :, 0])
+
+
+def scale_raster(raster, scale):
+    """Resize an (rgb, mask) raster by scale, as TextClip.resized does."""
+    rgb, mask = raster
+    size = (max(int(round(rgb.shape[1] * scale)), 1), max(int(round(rgb.shape[0] * scale)), 1))
+    scaled_rgb = np.asarray(Image.fromarray(rgb).resize(size, Image.LANCZOS), dtype=np.uint8)
+    scaled_mask = np.asarray(Image.fromarray(mask).resize(size, Image.BILINEAR),
+                             dtype=np.float32)
+    return scaled_rgb, np.clip(scaled_mask, 0.0, 1.0)
+
+
+def raster_cache_stats():
+    """Hit/miss counters and current size of the word raster cache."""
+    lookups = RASTER_STATS['hits'] + RASTER_STATS['misses']
+    return {
+        'hits': RASTER_STATS['hits'],
+        'misses': RASTER_STATS['misses'],
+        'size': len(_RASTER_CACHE),
+        'hit_rate': RASTER_STATS['hits'] / lookups if lookups else 0.0,
+    }
+
+
+GLOW_SCALE = 1.05      # glow raster is the word scaled up slightly
+SHADOW_OFFSET = 2      # shadow sits this many pixels right and below the text
+SHADOW_OPACITY = 0.5
+GLOW_OPACITY = 0.3
+
+
+# One laid-out caption word. The word is idle at (x, y) from section_start
+# to section_end, and raised by `rise` pixels while spoken (start to end).
+WordPlacement = namedtuple('WordPlacement', [
+    'text', 'font', 'font_size', 'color', 'x', 'y', 'rise',
+    'start', 'end', 'section_start', 'section_end',
+])
+
+
+SPRITE_CACHE_SIZE = 2048
+
+
+# Pre-baked word sprites: shadow, optional glow and text composited once into
+# one premultiplied (rgb, alpha) layer, keyed like the raster cache plus state.
+_SPRITE_CACHE = OrderedDict()
+
+
+def _composite_over(canvas_rgb, canvas_alpha, rgb, mask, x, y, opacity=1.0):
+    """Composite a straight-alpha raster over a premultiplied canvas in place."""
+    h, w = mask.shape
+    alpha = mask[:, :, None] * opacity
+    region_rgb = canvas_rgb[y:y + h, x:x + w]
+    region_alpha = canvas_alpha[y:y + h, x:x + w]
+    region_rgb[:] = rgb * alpha + region_rgb * (1 - alpha)
+    region_alpha[:] = alpha + region_alpha * (1 - alpha)
+
+
+def get_word_sprite(text, font=FONT_PATH, font_size=54, color="white", raised=False,
+                    cache=True):
+    """
+    Return the premultiplied (rgb, alpha) float32 sprite for one word state:
+    shadow and text for idle words, plus the glow for raised (spoken) words.
+    The sprite's origin is the text's top-left corner. With cache=False
+    neither the sprite nor its rasters are kept in the caches.
+    """
+    key = (text, font, font_size, color, raised)
+    sprite = _SPRITE_CACHE.get(key) if cache else None
+    if sprite is not None:
+        _SPRITE_CACHE.move_to_end(key)
+        return sprite
+
+    rgb, mask = get_word_raster(text, font, font_size, color, cache=cache)
+    layers = [(rgb, mask, SHADOW_OFFSET, SHADOW_OFFSET, SHADOW_OPACITY)]
+    if raised:
+        glow_rgb, glow_mask = get_word_raster(text, font, font_size, color, scale=GLOW_SCALE,
+                                               cache=cache)
+        layers.append((glow_rgb, glow_mask, 0, 0, GLOW_OPACITY))
+    layers.append((rgb, mask, 0, 0, 1.0))
+
+    h = max(m.shape[0] + y for _, m, _, y, _ in layers)
+    w = max(m.shape[1] + x for _, m, x, _, _ in layers)
+    sprite_rgb = np.zeros((h, w, 3), dtype=np.float32)
+    sprite_alpha = np.zeros((h, w, 1), dtype=np.float32)
+    for layer_rgb, layer_mask, x, y, opacity in layers:
+        _composite_over(sprite_rgb, sprite_alpha, layer_rgb, layer_mask, x, y, opacity)
+    sprite = (sprite_rgb, sprite_alpha)
+
+    if cache:
+        _SPRITE_CACHE[key] = sprite
+        if len(_SPRITE_CACHE) > SPRITE_CACHE_SIZE:
+            _SPRITE_CACHE.popitem(last=False)
+    return sprite
+
+
+def sprite_clip(sprite):
+    """ImageClip (with mask) showing a premultiplied sprite, for the layered renderer."""
+    sprite_rgb, sprite_alpha = sprite
+    straight = sprite_rgb / np.maximum(sprite_alpha, 1e-6)
+    rgb = np.clip(np.rint(straight), 0, 255).astype(np.uint8)
+    return ImageClip(rgb).with_mask(ImageClip(sprite_alpha[:, :, 0], is_mask=True))
+
+
+def blit_sprite(frame, sprite, x, y):
+    """Blend a premultiplied sprite into frame in place, clipped to the frame."""
+    sprite_rgb, sprite_alpha = sprite
+    h, w = sprite_alpha.shape[:2]
+    frame_h, frame_w = frame.shape[:2]
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + w, frame_w), min(y + h, frame_h)
+    if x1 <= x0 or y1 <= y0:
+        return
+    region = frame[y0:y1, x0:x1]
+    alpha = sprite_alpha[y0 - y:y1 - y, x0 - x:x1 - x]
+    region[:] = sprite_rgb[y0 - y:y1 - y, x0 - x:x1 - x] + region * (1 - alpha)
+
+
+class IntervalIndex:
+    """
+    Items with [start, end) intervals, sorted by start. active(t) only visits
+    items starting in (t - longest interval, t], and counts how many it
+    visited per query in `stats`.
+    """
+
+    def __init__(self, items, intervals):
+        self.items = list(items)
+        self.order = sorted(range(len(self.items)), key=lambda i: intervals[i][0])
+        self.starts = [intervals[i][0] for i in self.order]
+        self.ends = [intervals[i][1] for i in self.order]
+        self.max_span = max((e - s for s, e in zip(self.starts, self.ends)), default=0.0)
+        self.stats = {'queries': 0, 'visited': 0, 'last_visited': 0}
+
+    def active(self, t):
+        """Items active at t, in their original order."""
+        lo = bisect.bisect_left(self.starts, t - self.max_span)
+        hi = bisect.bisect_right(self.starts, t)
+        self.stats['queries'] += 1
+        self.stats['visited'] += hi - lo
+        self.stats['last_visited'] = hi - lo
+        positions = sorted(self.order[i] for i in range(lo, hi) if t < self.ends[i])
+        return [self.items[i] for i in positions]
+
+    def mean_visited(self):
+        """Average number of items visited per query."""
+        return self.stats['visited'] / self.stats['queries'] if self.stats['queries'] else 0.0
+
+
+class IndexedCompositeVideoClip(CompositeVideoClip):
+    """
+    CompositeVideoClip whose frames only visit the layers playing at t,
+    found through an IntervalIndex instead of checking every layer. Layers
+    without an end are always checked. Pass a full-length base clip as the
+    background (use_bgclip=True) so it does not widen every index query.
+    """
+
+    def __init__(self, clips, *args, **kwargs):
+        super().__init__(clips, *args, **kwargs)
+        if not self.created_bg and self.bg.end is not None and self.end is not None:
+            # CompositeVideoClip times itself by the layers above a background
+            # clip only; the background plays for its whole duration
+            self.duration = self.end = max(self.end, self.bg.end)
+        bounded = [i for i, c in enumerate(self.clips) if c.end is not None]
+        self.unbounded = [i for i, c in enumerate(self.clips) if c.end is None]
+        self.interval_index = IntervalIndex(
+            bounded, [(self.clips[i].start, self.clips[i].end) for i in bounded])
+
+    def playing_clips(self, t=0):
+        positions = self.interval_index.active(t)
+        if self.unbounded:
+            positions = sorted(positions + [i for i in self.unbounded if self.clips[i].is_playing(t)])
+        return [self.clips[i] for i in positions]
+
+
+LAZY_LOOKAHEAD = 1.0   # seconds before a section starts that its sprites are built
+
+
+def caption_overlay_clip(video, placements, lazy=False, lookahead=LAZY_LOOKAHEAD):
+    """
+    Return video with the caption words drawn on every frame in one NumPy
+    pass. Only the words whose section is on screen at t are looked at, so
+    per-frame cost follows the visible word count, not the transcript length.
+    Blending happens on the bounding band of those words only; the rest of
+    the frame is copied through untouched.
+
+    With lazy=True a section's sprites are only built `lookahead` seconds
+    before it starts and dropped once it ends, so memory follows the number
+    of captions on screen rather than the transcript length.
+    """
+    def build_sprites(p):
+        return (get_word_sprite(p.text, p.font, p.font_size, p.color, cache=not lazy),
+                get_word_sprite(p.text, p.font, p.font_size, p.color, raised=True, cache=not lazy))
+
+    index = IntervalIndex(range(len(placements)),
+                          [(p.section_start, p.section_end) for p in placements])
+    band_stats = {'frames': 0, 'band_pixels': 0, 'frame_pixels': 0}
+    sprites = None if lazy else [build_sprites(p) for p in placements]
+    window_index = IntervalIndex(
+        range(len(placements)),
+        [(p.section_start - lookahead, p.section_end) for p in placements]) if lazy else None
+    live = {}
+    live_stats = {'peak_live': 0, 'built': 0}
+
+    def draw_captions(get_frame, t):
+        nonlocal live
+        if lazy:
+            # Keep exactly the sections inside their lookahead window at t
+            window = window_index.active(t)
+            live_stats['built'] += sum(1 for i in window if i not in live)
+            live = {i: live[i] if i in live else build_sprites(placements[i]) for i in window}
+            live_stats['peak_live'] = max(live_stats['peak_live'], len(live))
+
+        frame = get_frame(t)
+        active = index.active(t)
+        if not active:
+            return frame
+
+        draws = []
+        for i in active:
+            p = placements[i]
+            idle, raised = live[i] if lazy else sprites[i]
+            if p.start <= t < p.end:
+                draws.append((raised, p.x, p.y - p.rise))
+            else:
+                draws.append((idle, p.x, p.y))
+
+        # Bounding band of everything drawn this frame
+        frame_h, frame_w = frame.shape[:2]
+        y0 = max(min(y for _, _, y in draws), 0)
+        y1 = min(max(y + s[1].shape[0] for s, _, y in draws), frame_h)
+        x0 = max(min(x for _, x, _ in draws), 0)
+        x1 = min(max(x + s[1].shape[1] for s, x, _ in draws), frame_w)
+        band_stats['frames'] += 1
+        band_stats['frame_pixels'] += frame_h * frame_w
+        if y1 <= y0 or x1 <= x0:
+            return frame
+        band_stats['band_pixels'] += (y1 - y0) * (x1 - x0)
+
+        frame = np.array(frame, dtype=np.uint8)
+        band = frame[y0:y1, x0:x1].astype(np.float32)
+        for sprite, x, y in draws:
+            blit_sprite(band, sprite, x - x0, y - y0)
+        frame[y0:y1, x0:x1] = np.clip(band, 0, 255)
+        return frame
+
+    captioned = video.transform(draw_captions)
+    captioned.interval_index = index
+    captioned.band_stats = band_stats
+    # Lets videoRender.render_pipelined decode video on its own thread, for
+    # as long as a derived clip still uses this exact frame function
+    captioned.pipeline_stages = (video, draw_captions, captioned.frame_function)
+    if lazy:
+        captioned.live_stats = live_stats
+    return captioned
+
+
+ASS_COLORS = {'white': 'FFFFFF', 'yellow': '00FFFF'}   # ASS colours are BGR hex
+
+
+def _ass_time(seconds):
+    """Format seconds as an ASS timestamp (H:MM:SS.cc)."""
+    cs = int(round(max(seconds, 0.0) * 100))
+    return f"{cs // 360000}:{cs // 6000 % 60:02d}:{cs // 100 % 60:02d}.{cs % 100:02d}"
+
+
+def _ass_alpha(opacity):
+    """ASS alpha override for an opacity in [0, 1] (00 is opaque, FF transparent)."""
+    return f"&H{int(round((1.0 - opacity) * 255)):02X}&"
+
+
+def write_ass_captions(placements, path, width, height):
+    """
+    Write the laid-out caption words as an Advanced SubStation Alpha script
+    that reproduces the overlay look: idle and raised (by `rise`) states,
+    the 50% shadow offset by SHADOW_OFFSET, the 30% glow scaled by
+    GLOW_SCALE, and the per-word yellow/white colour. Each state is a
+    Dialogue event positioned in pixels with override tags.
+    """
+    font = placements[0].font if placements else FONT_PATH
+    font_size = placements[0].font_size if placements else int(width * 0.05)
+    # libass sizes a font by ascent + descent, Pillow by the em: ask libass
+    # for Pillow's ascent + descent so both draw the same em
+    ascent, descent = get_font(font, font_size).getmetrics()
+    ass_font_size = ascent + descent
+    lines = [
+        "[Script Info]",
+        "ScriptType: v4.00+",
+        f"PlayResX: {width}",
+        f"PlayResY: {height}",
+        "WrapStyle: 2",
+        "ScaledBorderAndShadow: yes",
+        "",
+        "[V4+ Styles]",
+        "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, "
+        "BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, "
+        "BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding",
+        f"Style: Caption,Raleway,{ass_font_size},&H00FFFFFF,&H00FFFFFF,&H00000000,&H00000000,"
+        "-1,-1,0,0,100,100,0,0,1,1,0,7,0,0,0,1",
+        "",
+        "[Events]",
+        "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text",
+    ]
+
+    def event(layer, start, end, x, y, text, tags=""):
+        if end > start:
+            lines.append(f"Dialogue: {layer},{_ass_time(start)},{_ass_time(end)},Caption,,0,0,0,,"
+                         f"{{\\an7\\pos({x},{y}){tags}}}{text}")
+
+    shadow_tags = f"\\alpha{_ass_alpha(SHADOW_OPACITY)}"
+    glow_scale = int(round(GLOW_SCALE * 100))
+    glow_tags = f"\\fscx{glow_scale}\\fscy{glow_scale}\\alpha{_ass_alpha(GLOW_OPACITY)}"
+    for p in placements:
+        # Braces would start an override block
+        text = p.text.replace("{", "(").replace("}", ")")
+        color = f"\\c&H{ASS_COLORS.get(p.color, ASS_COLORS['white'])}&"
+        raised_y = p.y - p.rise
+        for start, end in ((p.section_start, p.start), (p.end, p.section_end)):
+            event(0, start, end, p.x + SHADOW_OFFSET, p.y + SHADOW_OFFSET, text, color + shadow_tags)
+            event(2, start, end, p.x, p.y, text, color)
+        event(0, p.start, p.end, p.x + SHADOW_OFFSET, raised_y + SHADOW_OFFSET, text, color + shadow_tags)
+        event(1, p.start, p.end, p.x, raised_y, text, color + glow_tags)
+        event(2, p.start, p.end, p.x, raised_y, text, color)
+
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("\n".join(lines) + "\n")
+    return path
+
+
+def ffmpeg_filter_path(path):
+    """Escape a file path for use as an ffmpeg filter option value."""
+    return path.replace("\\", "/").replace(":", "\\:").replace("'", "\\'")
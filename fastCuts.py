@@ -1,9 +1,20 @@
 import traceback
 import os
+import json
 import random
+import shutil
+import subprocess
+import tempfile
 import numpy as np
 import sys
-
+from PIL import Image
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from audioEnvelope import rms_envelope
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+from videoRender import (concat_stream_copy, matching_encode_args, probe_duration,
+                         probe_video_stream, smart_cut, write_pipelined)
 from moviepy import (
     VideoFileClip,
     TextClip,
@@ -23,136 +34,444 @@ from moviepy import (
 TRANSITION_DURATION = 0.31  # seconds
 SILENCE_THRESHOLD = 0.15 #.25 is too much, .01 is too little with chunk duration of 0.1
 CHUNK_DURATION = 0.30
+ANALYSIS_SAMPLE_RATE = 22050
+
+
+def chunk_rms(audio, chunk_size):
+    """RMS of each complete chunk_size block of a mono signal."""
+    num_chunks = len(audio) // chunk_size
+    blocks = np.asarray(audio[:num_chunks * chunk_size], dtype=np.float64)
+    return np.sqrt((blocks.reshape(num_chunks, chunk_size) ** 2).mean(axis=1))
+
+
+def silent_intervals_from_levels(chunk_levels, global_rms, duration, chunk_duration=CHUNK_DURATION):
+    """Silent periods, padded by TRANSITION_DURATION, from per-chunk RMS levels."""
+    num_chunks = len(chunk_levels)
+    print(global_rms)
+    threshold = global_rms * SILENCE_THRESHOLD
+    print(threshold)
+    silent_intervals = []
+    current_start = None
+
+    for i in range(num_chunks):
+        rms = chunk_levels[i]
+
+        if rms < threshold:
+            if current_start is None:
+                current_start = i * chunk_duration
+        else:
+            if current_start is not None:
+                start = max(0, current_start - TRANSITION_DURATION)
+                end = min(duration, i * chunk_duration + TRANSITION_DURATION)
+                silent_intervals.append((start, end))
+                current_start = None
+
+    # Final silence
+    if current_start is not None:
+        start = max(0, current_start - TRANSITION_DURATION)
+        end = min(duration, num_chunks * chunk_duration + TRANSITION_DURATION)
+        silent_intervals.append((start, end))
+
+    return silent_intervals
+
+
+def plays_whole_file(clip):
+    """True if clip plays its source file from start to end, e.g. not a subclip of it."""
+    reader = getattr(clip, 'reader', None)
+    if not getattr(clip, 'filename', None) or reader is None or clip.duration is None:
+        return False
+    return abs(clip.duration - reader.duration) < 1 / (clip.fps or 30)
 
 
 def detect_silent_intervals(clip, threshold=SILENCE_THRESHOLD, chunk_duration=CHUNK_DURATION):
     """Identify silent periods using audio analysis."""
     try:
-        audio = clip.audio.to_soundarray(fps=22050)
-        if audio.ndim > 1:
-            audio = audio.mean(axis=1)
-        sample_rate = 22050
-        chunk_size = int(chunk_duration * sample_rate)
-        num_chunks = len(audio) // chunk_size
-        print('HEREHERE')
-        
-        global_rms = np.sqrt((audio**2).mean())
-        print(global_rms)
-        threshold = global_rms * SILENCE_THRESHOLD
-        print(threshold)
-        silent_intervals = []
-        current_start = None
-
-        for i in range(num_chunks):
-            chunk = audio[i*chunk_size:(i+1)*chunk_size]
-            rms = np.sqrt((chunk**2).mean())
-
-            if rms < threshold:
-                if current_start is None:
-                    current_start = i * chunk_duration
-            else:
-                if current_start is not None:
-                    start = max(0, current_start - TRANSITION_DURATION)
-                    end = min(clip.duration, i * chunk_duration + TRANSITION_DURATION)
-                    silent_intervals.append((start, end))
-                    current_start = None
-
-        # Final silence
-        if current_start is not None:
-            start = max(0, current_start - TRANSITION_DURATION)
-            end = min(clip.duration, num_chunks * chunk_duration + TRANSITION_DURATION)
-            silent_intervals.append((start, end))
-
-        return silent_intervals
+        if plays_whole_file(clip):
+            # Read from the source's loudness sidecar; decoded only on first use
+            chunk_levels, global_rms, chunk_duration = rms_envelope(clip.filename, chunk_duration)
+        else:
+            # Subclips and in-memory clips: analyse the audio they actually play
+            audio = clip.audio.to_soundarray(fps=ANALYSIS_SAMPLE_RATE)
+            if audio.ndim > 1:
+                audio = audio.mean(axis=1)
+            chunk_size = int(chunk_duration * ANALYSIS_SAMPLE_RATE)
+            chunk_levels = chunk_rms(audio, chunk_size)
+            chunk_duration = chunk_size / ANALYSIS_SAMPLE_RATE
+            global_rms = np.sqrt((audio**2).mean())
+        return silent_intervals_from_levels(chunk_levels, global_rms, clip.duration, chunk_duration)
     except Exception as e:
         traceback.print_exc()
         return []
 
 
-def split_active_segments(clip, silent_intervals):
-    """Extract non-silent segments from the clip."""
+def active_intervals(duration, silent_intervals):
+    """(start, end) of the non-silent stretches between silent_intervals."""
     active_segments = []
     last_end = 0
     for start, end in sorted(silent_intervals):
         if start > last_end:
             active_segments.append((last_end, start))
         last_end = end
-    if last_end < clip.duration:
-        active_segments.append((last_end, clip.duration))
-    return [clip.subclipped(s, e) for s, e in active_segments]
+    if last_end < duration:
+        active_segments.append((last_end, duration))
+    return active_segments
 
 
-def create_zoom_effect(segment, target_w, target_h):
-    """Apply smooth zoom effect and center-crop back to original resolution."""
+def split_active_segments(clip, silent_intervals):
+    """Extract non-silent segments from the clip."""
+    return [clip.subclipped(s, e) for s, e in active_intervals(clip.duration, silent_intervals)]
+
+
+def fit_aspect(src_w, src_h, target_w, target_h):
+    """Size of the largest centered region of the source with the target's aspect ratio."""
+    if src_w * target_h > src_h * target_w:
+        return src_h * target_w / target_h, src_h
+    return src_w, src_w * target_h / target_w
+
+
+def zoom_crop_boxes(zooms, src_w, src_h, target_w, target_h):
+    """
+    Source rectangles (x0, y0, x1, y1), one row per zoom factor, that a
+    centered zoom samples before scaling to target size. At zoom 1 this is
+    the largest centered region with the target's aspect ratio, so other
+    aspect ratios are center-cropped rather than stretched. Zooms below 1
+    can give rectangles reaching past the source, i.e. black borders.
+    """
+    zooms = np.asarray(zooms, dtype=np.float64)
+    base_w, base_h = fit_aspect(src_w, src_h, target_w, target_h)
+    box_w = base_w / zooms
+    box_h = base_h / zooms
+    x0 = (src_w - box_w) / 2
+    y0 = (src_h - box_h) / 2
+    return np.stack([x0, y0, x0 + box_w, y0 + box_h], axis=1)
+
+
+def zoom_frame(frame, box, target_w, target_h):
+    """Scale the box region of frame straight to target size; parts outside the frame stay black."""
+    src_h, src_w = frame.shape[:2]
+    x0, y0, x1, y1 = box
+    image = Image.fromarray(frame)
+    if x0 >= 0 and y0 >= 0 and x1 <= src_w and y1 <= src_h:
+        return np.asarray(image.resize((target_w, target_h), Image.BILINEAR, box=(x0, y0, x1, y1)))
+
+    # Zoomed out: the visible part of the frame lands in a window of the output
+    sx = target_w / (x1 - x0)
+    sy = target_h / (y1 - y0)
+    cx0, cy0, cx1, cy1 = max(x0, 0), max(y0, 0), min(x1, src_w), min(y1, src_h)
+    u0, v0 = int(round((cx0 - x0) * sx)), int(round((cy0 - y0) * sy))
+    u1, v1 = int(round((cx1 - x0) * sx)), int(round((cy1 - y0) * sy))
+    out = np.zeros((target_h, target_w, 3), dtype=np.uint8)
+    if u1 > u0 and v1 > v0:
+        out[v0:v1, u0:u1] = np.asarray(
+            image.resize((u1 - u0, v1 - v0), Image.BILINEAR, box=(cx0, cy0, cx1, cy1)))[:, :, :3]
+    return out
+
+
+def zoom_filter(zoom_keyframes, src_w, src_h, target_w, target_h, fps):
+    """
+    ffmpeg filter chain for the same centered zoom as zoom_crop_boxes:
+    zoompan with the zoom curve as a piecewise-linear expression of input
+    time, over the source cropped to the target's aspect ratio and padded
+    with black when the curve zooms out below 1.
+    """
+    key_times = [t for t, _ in zoom_keyframes]
+    zoom_vals = [z for _, z in zoom_keyframes]
+    min_zoom = min(min(zoom_vals), 1.0)
+
+    # zoompan only zooms in, so zoom relative to the padded frame instead
+    expr = f"{zoom_vals[-1] / min_zoom:.6f}"
+    for i in range(len(key_times) - 2, -1, -1):
+        t0, t1 = key_times[i], key_times[i + 1]
+        z0, z1 = zoom_vals[i] / min_zoom, zoom_vals[i + 1] / min_zoom
+        if t1 <= t0:
+            continue
+        segment = f"{z0:.6f}+({z1 - z0:.6f})*(it-{t0})/{t1 - t0}"
+        expr = f"if(lt(it,{t1}),{segment},{expr})"
+    expr = f"if(lt(it,{key_times[0]}),{zoom_vals[0] / min_zoom:.6f},{expr})"
+
+    # Frame zoompan works on: the zoom-1 region, widened for any zoom-out
+    base_w, base_h = fit_aspect(src_w, src_h, target_w, target_h)
+    frame_w = int(round(base_w / min_zoom / 2)) * 2
+    frame_h = int(round(base_h / min_zoom / 2)) * 2
+    crop_w, crop_h = min(frame_w, src_w), min(frame_h, src_h)
+    filters = []
+    if (crop_w, crop_h) != (src_w, src_h):
+        filters.append(f"crop={crop_w}:{crop_h}")
+    if (frame_w, frame_h) != (crop_w, crop_h):
+        filters.append(f"pad={frame_w}:{frame_h}:(ow-iw)/2:(oh-ih)/2:black")
+    filters.append(
+        f"zoompan=z='{expr}':x='iw/2-iw/zoom/2':y='ih/2-ih/zoom/2'"
+        f":d=1:s={target_w}x{target_h}:fps={fps}")
+    return ",".join(filters)
+
+
+def create_zoom_effect(segment, target_w, target_h, zoom_keyframes=None):
+    """
+    Apply smooth zoom effect and center-crop back to original resolution.
+    zoom_keyframes is [(t, zoom), ...] in segment time; random if omitted.
+    The crop rectangle of every frame is precomputed from the zoom curve, and
+    only that region of the source is scaled to target size.
+    """
     dur = segment.duration
-    zoom_vals = [random.uniform(0.9, 1.2) for _ in range(3)]
-
-    # Interpolated zoom function
-    def zoom_func(t):
-        return np.interp(t, [0, dur/2, dur], zoom_vals)
-
-    # Apply resizing
-    #videofileclip
-    zoom = random.uniform(0.9, 1.2)
-    zoomed = segment.with_effects([vfx.Resize(lambda t: (zoom_func(t) * target_w, zoom_func(t) * target_h))])
+    if zoom_keyframes is None:
+        zoom_keyframes = [(t, random.uniform(*ZOOM_RANGE)) for t in (0, dur/2, dur)]
+    key_times = [t for t, _ in zoom_keyframes]
+    zoom_vals = [z for _, z in zoom_keyframes]
 
-    print(type(zoomed))
+    # Interpolated zoom curve, sampled once per frame
+    fps = segment.fps or 30
+    frame_times = np.arange(int(np.ceil(dur * fps)) + 1) / fps
+    boxes = zoom_crop_boxes(np.interp(frame_times, key_times, zoom_vals),
+                            segment.w, segment.h, target_w, target_h)
 
-    # Center-crop using built-in crop effect
-    # cropped = vfx.Crop(
-    #     zoomed,
-    #     width=target_w,
-    #     height=target_h,
-    #     x_center=segment.w / 2,
-    #     y_center=segment.h / 2
-    # )
-    cropped = zoomed.with_effects([
-        vfx.Crop(width=target_w, height=target_h, x_center=segment.w / 2, y_center=segment.h / 2)
-    ])
+    def zoom_kernel(get_frame, t):
+        box = boxes[min(int(round(t * fps)), len(boxes) - 1)]
+        return zoom_frame(get_frame(t), box, target_w, target_h)
 
-    return cropped
+    return segment.transform(zoom_kernel)
 
 
 def create_fast_cuts(video_file):
+    """Analyze video_file and render its fast cuts as a MoviePy clip."""
     print(f"Processing {video_file}")
-    clip = VideoFileClip(video_file)
-    print("Audio object:", clip.audio)
-    clip.audio.write_audiofile("test_audio.wav")
-
-    # Detect silent intervals and split into active clips
-    silences = detect_silent_intervals(clip)
-    segments = split_active_segments(clip, silences)
-
-    # Filter out segments that are too short
-    MIN_SEGMENT_DURATION = 0.2
-    segments = [s for s in segments if s.duration >= MIN_SEGMENT_DURATION]
-
-    if not segments:
+    edl = analyze_fast_cuts(video_file)
+    return render_edl(edl)
+
+
+# Edit decision lists: analysis writes one, render_edl turns it into a clip
+EDL_VERSION = 1
+MIN_SEGMENT_DURATION = 0.2
+SPEED_CHOICES = [0.95, 1.0, 1.05]
+ZOOM_RANGE = (0.9, 1.2)
+
+
+def snap_to_frame(t, fps):
+    """t rounded to the nearest frame time at fps."""
+    return round(round(t * fps) / fps, 6)
+
+
+def edl_path_for(video_file):
+    """Default EDL location next to the source, e.g. clip.mp4 -> clip.edl.json."""
+    return os.path.splitext(video_file)[0] + '.edl.json'
+
+
+def analyze_fast_cuts(video_file, zoom=False, seed=None, edl_path=None):
+    """
+    Decide the fast cuts for video_file without building any clips: the kept
+    source segments, a speed factor for each and, with zoom=True, zoom
+    keyframes [(t, zoom), ...] in segment time. Returns the EDL dict and
+    writes it as JSON to edl_path when given.
+    """
+    infos = ffmpeg_parse_infos(video_file)
+    duration = infos['duration']
+    fps = infos['video_fps']
+    rng = random.Random(seed)
+
+    chunk_levels, global_rms, chunk_duration = rms_envelope(video_file, CHUNK_DURATION)
+    silences = silent_intervals_from_levels(chunk_levels, global_rms, duration, chunk_duration)
+
+    segments = []
+    for start, end in active_intervals(duration, silences):
+        # Filter out segments that are too short
+        if end - start < MIN_SEGMENT_DURATION:
+            continue
+        # Cut on frame boundaries, so video and audio pieces match in length
+        segment = {'start': snap_to_frame(start, fps), 'end': snap_to_frame(end, fps),
+                   'speed': rng.choice(SPEED_CHOICES), 'zoom': None}
+        if zoom:
+            dur = end - start
+            segment['zoom'] = [[round(t, 3), round(rng.uniform(*ZOOM_RANGE), 3)]
+                               for t in (0, dur / 2, dur)]
+        segments.append(segment)
+
+    edl = {
+        'version': EDL_VERSION,
+        'source': os.path.abspath(video_file),
+        'duration': duration,
+        'size': list(infos['video_size']),
+        'fps': infos['video_fps'],
+        'segments': segments,
+    }
+    kept = sum(s['end'] - s['start'] for s in segments)
+    print(f"Analyzed {video_file}: keeping {len(segments)} segments, {kept:.1f}s of {duration:.1f}s")
+    if edl_path:
+        write_edl(edl, edl_path)
+    return edl
+
+
+def write_edl(edl, path):
+    """Write edl as JSON, atomically."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(edl, f, indent=2)
+    os.replace(tmp_path, path)
+    print(f"Wrote EDL: {path}")
+
+
+def load_edl(path):
+    """Read an EDL written by write_edl."""
+    with open(path, 'r', encoding='utf-8') as f:
+        edl = json.load(f)
+    if edl.get('version') != EDL_VERSION:
+        raise ValueError(f"Unsupported EDL version in {path}: {edl.get('version')}")
+    return edl
+
+
+def analyze_folder(folder, workers=None, zoom=False):
+    """Write an EDL next to every .mp4 in folder, analyzing them in parallel processes."""
+    videos = [os.path.join(folder, name) for name in sorted(os.listdir(folder))
+              if name.lower().endswith('.mp4')]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(analyze_fast_cuts, v, zoom, None, edl_path_for(v)): v
+                   for v in videos}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception:
+                print(f"[ERROR] Analysis failed for {futures[future]}")
+                traceback.print_exc()
+    return [edl_path_for(v) for v in videos]
+
+
+def render_edl(edl, clip=None):
+    """Build the MoviePy clip described by an EDL (dict or JSON path)."""
+    if isinstance(edl, str):
+        edl = load_edl(edl)
+    clip = clip or VideoFileClip(edl['source'])
+    if not edl['segments']:
         return clip
 
     processed = []
-    for seg in segments:
-        speed = random.choice([0.95, 1.0, 1.05])
-        speed_clip = seg.with_effects([vfx.MultiplySpeed(speed)])
-        processed.append(speed_clip)
+    for segment in edl['segments']:
+        seg = clip.subclipped(segment['start'], segment['end'])
+        if segment.get('zoom'):
+            seg = create_zoom_effect(seg, clip.w, clip.h, segment['zoom'])
+        if segment['speed'] != 1.0:
+            seg = seg.with_effects([vfx.MultiplySpeed(segment['speed'])])
+        processed.append(seg)
 
     # No transitions
-    final_clips = processed
-
-    final = concatenate_videoclips(final_clips, method="compose")
-    
-    return final
-
-
+    return concatenate_videoclips(processed, method="compose")
+
+
+def render_edl_ffmpeg(edl, output_path):
+    """
+    Render an EDL (dict or JSON path) with ffmpeg alone, without decoding
+    frames in Python. Segments at speed 1.0 are smart-cut: whole GOPs are
+    stream-copied and only the partial GOP at each cut is re-encoded.
+    Speed-changed and zoomed segments are re-encoded through setpts and
+    zoom_filter with the source's codec settings. Sources libx264 cannot
+    match get every piece re-encoded, so nothing copied is mixed with
+    foreign encodes. The audio of all segments is trimmed, atempo'd,
+    padded or cut to the length of its video piece, and joined in one
+    filter script and encoded once.
+    """
+    if isinstance(edl, str):
+        edl = load_edl(edl)
+    source = edl['source']
+    segments = edl['segments'] or [{'start': 0, 'end': edl['duration'], 'speed': 1.0, 'zoom': None}]
+    fps = edl['fps']
+    stream = probe_video_stream(source)
+    encode_args = matching_encode_args(stream)
+    if encode_args is None:
+        print(f"{stream.get('codec_name', 'unknown')} source can't be stream-copied "
+              f"next to re-encoded cuts; re-encoding every segment")
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        pieces = []
+        piece_durations = []
+        for i, segment in enumerate(segments):
+            piece = os.path.join(work_dir, f"{i:04d}.mp4")
+            start, end = snap_to_frame(segment['start'], fps), snap_to_frame(segment['end'], fps)
+            speed = segment['speed']
+            if encode_args is not None and speed == 1.0 and not segment.get('zoom'):
+                smart_cut(source, start, end, piece, with_audio=False, stream=stream)
+            else:
+                filters = []
+                if segment.get('zoom'):
+                    width, height = edl['size']
+                    filters.append(zoom_filter(segment['zoom'], width, height, width, height, fps))
+                filters.append(f"setpts=(PTS-STARTPTS)/{speed}")
+                # One spare input frame; -frames:v sets the piece's exact length
+                subprocess.run([
+                    'ffmpeg', '-y', '-v', 'error', '-ss', str(start), '-t', str(end - start + 1 / fps),
+                    '-i', source, '-map', '0:v:0', '-an',
+                    '-vf', ",".join(filters), '-r', str(fps),
+                    '-frames:v', str(max(1, round((end - start) / speed * fps))),
+                    *(encode_args or ['-c:v', 'libx264', '-pix_fmt', 'yuv420p']), piece
+                ], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            pieces.append(piece)
+            # Pieces come out in whole frames (and copied GOPs can run past
+            # end), so each audio piece is cut to its video piece's length
+            piece_durations.append(probe_duration(piece))
+        video = concat_stream_copy(pieces, os.path.join(work_dir, 'video.mp4'))
+
+        if not ffmpeg_parse_infos(source).get('audio_found'):
+            shutil.move(video, output_path)
+            return output_path
+
+        filters = []
+        for segment, piece_duration in zip(segments, piece_durations):
+            start = snap_to_frame(segment['start'], fps)
+            end = start + piece_duration * segment['speed']
+            chain = f"[0:a]atrim=start={start}:end={end},asetpts=PTS-STARTPTS"
+            if segment['speed'] != 1.0:
+                chain += f",atempo={segment['speed']}"
+            chain += f",apad,atrim=end={piece_duration}"
+            filters.append(chain + f"[a{len(filters)}]")
+        labels = "".join(f"[a{i}]" for i in range(len(segments)))
+        filters.append(f"{labels}concat=n={len(segments)}:v=0:a=1[aout]")
+        script = os.path.join(work_dir, 'audio_filter.txt')
+        with open(script, 'w') as f:
+            f.write(";\n".join(filters))
+        audio = os.path.join(work_dir, 'audio.m4a')
+        subprocess.run([
+            'ffmpeg', '-y', '-v', 'error', '-i', source, '-filter_complex_script', script,
+            '-map', '[aout]', '-c:a', 'aac', audio
+        ], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+        subprocess.run([
+            'ffmpeg', '-y', '-v', 'error', '-i', video, '-i', audio,
+            '-map', '0:v:0', '-map', '1:a:0', '-c', 'copy', '-shortest', output_path
+        ], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+        video_duration = probe_duration(output_path, 'v:0')
+        audio_duration = probe_duration(output_path, 'a:0')
+        if abs(video_duration - audio_duration) > 1 / fps:
+            print(f"[WARN] Audio and video lengths differ: video {video_duration:.3f}s, "
+                  f"audio {audio_duration:.3f}s")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    print(f"Rendered {len(segments)} segments with ffmpeg: {output_path}")
+    return output_path
 
 
 if __name__ == "__main__":
-    input_file = "./clips/mass_produced/27_final.mp4"
-    if not os.path.isfile(input_file):
+    parser = argparse.ArgumentParser(description="Cut the silences out of a video.")
+    parser.add_argument("input_file", nargs="?", default="./clips/mass_produced/27_final.mp4")
+    parser.add_argument("--analyze-only", action="store_true",
+                        help="write the EDL next to the input (or every .mp4 in it, for a folder) and stop")
+    parser.add_argument("--edl", help="render this EDL instead of analyzing the input")
+    parser.add_argument("--ffmpeg", action="store_true",
+                        help="render with ffmpeg stream copy / smart cuts instead of MoviePy")
+    args = parser.parse_args()
+    input_file = args.input_file
+
+    if args.analyze_only and os.path.isdir(input_file):
+        analyze_folder(input_file)
+        sys.exit(0)
+    if not args.edl and not os.path.isfile(input_file):
         print(f"[ERROR] Input file not found: {input_file}")
         sys.exit(1)
-
-    result = create_fast_cuts(input_file)
+    if args.analyze_only:
+        analyze_fast_cuts(input_file, edl_path=edl_path_for(input_file))
+        sys.exit(0)
+    if args.ffmpeg:
+        render_edl_ffmpeg(args.edl or analyze_fast_cuts(input_file), "fast27_cuts_preview.mp4")
+        sys.exit(0)
+
+    result = render_edl(args.edl) if args.edl else create_fast_cuts(input_file)
     print(f"[MAIN] create_fast_cuts returned clip: duration={result.duration}, audio={result.audio}")
 
     # Preview first few seconds
@@ -165,15 +484,6 @@ if __name__ == "__main__":
     # print(f"[MAIN] Preview clip: duration={preview.duration}, audio={preview.audio}")
 
     output_file = "fast27_cuts_preview.mp4"
-    # turn on verbose logging to see ffmpeg audio steps
-    result.write_videofile(
-        output_file,
-        codec="libx264",
-        audio_codec="aac",
-        temp_audiofile="temp-audio.m4a",
-        remove_temp=True,
-        audio=True,
-        #verbose=True,
-        logger="bar"
-    )
+    # Decode/composite/encode run as overlapping stages; audio is encoded once
+    write_pipelined(result, output_file, codec="libx264")
     print(f"[MAIN] Saved preview: {output_file}")
@@ -6,8 +6,13 @@ import numpy as np
 import sys
 import subprocess
 import tempfile
-import wave
 import json
+import hashlib
+import difflib
+import threading
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from moviepy import (
     VideoFileClip, 
     TextClip, 
@@ -22,12 +27,373 @@ from moviepy import (
 )
 VOSK_MODEL_PATH = "models/vosk-model-en-us-0.22"
 
+from captionRenderer import (
+    FONT_PATH,
+    IndexedCompositeVideoClip,
+    WordPlacement,
+    caption_overlay_clip,
+    ffmpeg_filter_path,
+    measure_word,
+    get_word_sprite,
+    raster_cache_stats,
+    sprite_clip,
+    write_ass_captions,
+)
+
+from videoRender import (flatten_composition, pretrim_source, write_pipelined,
+                         write_with_audio_passthrough)
+
+from fastCuts import chunk_rms, SILENCE_THRESHOLD, CHUNK_DURATION
+from audioEnvelope import rms_envelope
+
 from vosk import Model, KaldiRecognizer
 
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# Process-wide Vosk model registry: each model path is loaded once, lazily,
+# and shared by every recognizer created in this process.
+_VOSK_MODELS = {}
+_VOSK_MODELS_LOCK = threading.Lock()
 
 
+def _resident_memory_mb():
+    """Return current resident memory of this process in MB, or None if unknown."""
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+
+def _peak_memory_mb():
+    """Return peak resident memory of this process in MB, or None if unknown."""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    if sys.platform == "darwin":
+        return rss / (1024 * 1024)
+    return rss / 1024
+
+
+def get_vosk_model(model_path=VOSK_MODEL_PATH):
+    """Return the shared Vosk Model for model_path, loading it on first use."""
+    with _VOSK_MODELS_LOCK:
+        model = _VOSK_MODELS.get(model_path)
+        if model is not None:
+            return model
+
+        # Current RSS where the OS exposes it (Linux), else the peak
+        memory_mb, memory_label = _resident_memory_mb, "resident memory"
+        if memory_mb() is None:
+            memory_mb, memory_label = _peak_memory_mb, "peak resident memory"
+        rss_before = memory_mb()
+        load_start = time.perf_counter()
+        model = Model(model_path)
+        load_time = time.perf_counter() - load_start
+        rss_after = memory_mb()
+
+        if rss_after is not None:
+            print(f"Loaded Vosk model {model_path} in {load_time:.2f}s "
+                  f"({memory_label} {rss_before:.0f} MB -> {rss_after:.0f} MB)")
+        else:
+            print(f"Loaded Vosk model {model_path} in {load_time:.2f}s")
+
+        _VOSK_MODELS[model_path] = model
+        return model
+
+
+def create_recognizer(sample_rate, model_path=VOSK_MODEL_PATH, words=True, grammar=None):
+    """
+    Create a fresh KaldiRecognizer backed by the shared model for model_path.
+    grammar, if given, is a list of phrases the recognizer is restricted to.
+    """
+    if grammar is not None:
+        rec = KaldiRecognizer(get_vosk_model(model_path), sample_rate, json.dumps(grammar))
+    else:
+        rec = KaldiRecognizer(get_vosk_model(model_path), sample_rate)
+    rec.SetWords(words)
+    return rec
+
+
+VOSK_SAMPLE_RATE = 16000
+PCM_CHUNK_BYTES = 8000   # 4000 frames of mono s16le
+
+
+def stream_pcm(video_file, sample_rate=VOSK_SAMPLE_RATE, chunk_bytes=PCM_CHUNK_BYTES,
+               duration=None):
+    """
+    Yield mono s16le PCM chunks decoded by ffmpeg straight from its stdout pipe.
+    Nothing is written to disk. Raises CalledProcessError if ffmpeg fails.
+    """
+    cmd = ['ffmpeg', '-v', 'error']
+    if duration is not None:
+        # Only decode the first `duration` seconds
+        cmd += ['-t', str(duration)]
+    cmd += [
+        '-i', video_file,
+        '-vn', '-acodec', 'pcm_s16le',
+        '-ar', str(sample_rate), '-ac', '1',
+        '-f', 's16le', 'pipe:1'
+    ]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        while True:
+            data = proc.stdout.read(chunk_bytes)
+            if not data:
+                break
+            yield data
+        stderr = proc.stderr.read()
+        if proc.wait() != 0:
+            raise subprocess.CalledProcessError(proc.returncode, cmd, stderr=stderr)
+    finally:
+        # Also reached when the consumer stops early
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        proc.stdout.close()
+        proc.stderr.close()
+
+
+def collect_words(result, words, timings, last_end_time):
+    """
+    Append the words of one Vosk result to words/timings, clamping so timings
+    never overlap. Returns the new last end time.
+    """
+    for word_info in result.get('result', []):
+        word = word_info['word']
+        start = round(word_info['start'], 3)
+        end = round(word_info['end'], 3)
+
+        # Ensure no overlapping timings
+        if start < last_end_time:
+            start = last_end_time
+        if end <= start:
+            end = start + 0.1  # Minimum duration
+
+        words.append(word)
+        timings.append((start, end))
+        last_end_time = end
+    return last_end_time
+
+
+MIN_PARALLEL_SEGMENT = 20.0   # seconds of audio before a silence may end a segment
+MAX_PARALLEL_SEGMENT = 90.0   # force a cut at the quietest chunk past this length
+
+
+def split_at_silences(pcm, sample_rate=VOSK_SAMPLE_RATE,
+                      min_len=MIN_PARALLEL_SEGMENT, max_len=MAX_PARALLEL_SEGMENT):
+    """
+    Split mono int16 PCM into (start_sample, end_sample) segments whose
+    boundaries fall in the middle of silent chunks, using the same RMS
+    threshold rule as fastCuts.detect_silent_intervals.
+    """
+    chunk_size = int(CHUNK_DURATION * sample_rate)
+    levels = chunk_rms(pcm, chunk_size)
+    if len(levels) == 0:
+        return [(0, len(pcm))]
+
+    global_rms = np.sqrt((pcm.astype(np.float64) ** 2).mean())
+    silent = levels < global_rms * SILENCE_THRESHOLD
+    min_chunks = int(min_len / CHUNK_DURATION)
+    max_chunks = int(max_len / CHUNK_DURATION)
+
+    cuts = []
+    seg_start = 0
+    i = 0
+    while i < len(levels):
+        if i - seg_start >= min_chunks and silent[i]:
+            # Cut in the middle of this silent run
+            run_end = i
+            while run_end < len(levels) and silent[run_end]:
+                run_end += 1
+            cut = (i + run_end) // 2
+            cuts.append(cut)
+            seg_start = cut
+            i = run_end
+            continue
+        if i - seg_start >= max_chunks:
+            # No silence found, cut at the quietest chunk instead
+            cut = seg_start + min_chunks + int(np.argmin(levels[seg_start + min_chunks:i]))
+            cuts.append(cut)
+            seg_start = cut
+        i += 1
+
+    bounds = [0] + [c * chunk_size for c in cuts] + [len(pcm)]
+    return [(s, e) for s, e in zip(bounds, bounds[1:]) if e > s]
+
+
+# Without fork every worker loads its own copy of the model, so keep the
+# default pool small there
+SPAWN_WORKERS = 2
+
+
+def _init_recognize_worker(model_path):
+    """Process pool initializer: make sure the worker holds the model once."""
+    get_vosk_model(model_path)
+
+
+def _recognize_segment(task):
+    """Process pool worker: recognize one PCM segment, timings on the global timeline."""
+    pcm_bytes, offset, model_path = task
+    rec = create_recognizer(VOSK_SAMPLE_RATE, model_path)
+    results = []
+    for i in range(0, len(pcm_bytes), PCM_CHUNK_BYTES):
+        if rec.AcceptWaveform(pcm_bytes[i:i + PCM_CHUNK_BYTES]):
+            results.extend(json.loads(rec.Result()).get('result', []))
+    results.extend(json.loads(rec.FinalResult()).get('result', []))
+    for word_info in results:
+        word_info['start'] += offset
+        word_info['end'] += offset
+    return results
+
+
+def recognize_chunks(chunks, model_path=VOSK_MODEL_PATH):
+    """Recognize an iterable of mono s16le PCM chunks serially in one recognizer."""
+    rec = create_recognizer(VOSK_SAMPLE_RATE, model_path)
+
+    words = []
+    timings = []
+    last_end_time = 0.0
+
+    for data in chunks:
+        if rec.AcceptWaveform(data):
+            last_end_time = collect_words(json.loads(rec.Result()),
+                                          words, timings, last_end_time)
+
+    # Process final result
+    collect_words(json.loads(rec.FinalResult()), words, timings, last_end_time)
 
-def transcribe_audio(video_file):
+    return words, timings
+
+
+def recognize_parallel(pcm, workers=None, model_path=VOSK_MODEL_PATH):
+    """
+    Recognize mono int16 PCM by splitting it at silences and recognizing the
+    segments in a process pool. Word timings are merged back onto the global
+    timeline. Where fork is available the model is loaded once here and
+    shared by the workers; elsewhere each worker loads it once, and the
+    default pool is capped at SPAWN_WORKERS.
+    """
+    segments = split_at_silences(pcm)
+    if 'fork' in multiprocessing.get_all_start_methods():
+        # Load the model here; forked workers share its pages copy-on-write
+        get_vosk_model(model_path)
+        context = multiprocessing.get_context('fork')
+        workers = workers or os.cpu_count() or 1
+    else:
+        context = None
+        workers = workers or min(os.cpu_count() or 1, SPAWN_WORKERS)
+    print(f"Recognizing {len(segments)} segments with {workers} workers")
+    tasks = [(pcm[s:e].tobytes(), s / VOSK_SAMPLE_RATE, model_path) for s, e in segments]
+
+    words = []
+    timings = []
+    last_end_time = 0.0
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks)), mp_context=context,
+                             initializer=_init_recognize_worker,
+                             initargs=(model_path,)) as pool:
+        # map keeps segment order, so clamping sees words in timeline order
+        for results in pool.map(_recognize_segment, tasks):
+            last_end_time = collect_words({'result': results}, words, timings, last_end_time)
+
+    return words, timings
+
+
+def transcribe_audio_parallel(video_file, workers=None, model_path=VOSK_MODEL_PATH):
+    """Transcribe audio with recognize_parallel after decoding the whole track."""
+    try:
+        pcm = np.frombuffer(b"".join(stream_pcm(video_file)), dtype=np.int16)
+    except subprocess.CalledProcessError as e:
+        print(f"Audio conversion failed: {e.stderr.decode()}")
+        return "[Audio extraction failed]", []
+
+    return recognize_parallel(pcm, workers, model_path)
+
+
+TRANSCRIPT_CACHE_DIR = os.path.join("cache", "transcripts")
+TRANSCRIPT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+
+def transcript_cache_key(pcm_bytes, model_path=VOSK_MODEL_PATH):
+    """Content hash of the decoded audio plus the model and recognizer settings."""
+    settings = {
+        'model': os.path.abspath(model_path),
+        'sample_rate': VOSK_SAMPLE_RATE,
+        'words': True,
+    }
+    digest = hashlib.sha256(pcm_bytes)
+    digest.update(json.dumps(settings, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def load_cached_transcript(key, cache_dir=TRANSCRIPT_CACHE_DIR):
+    """Return (words, timings) cached under key, or None on a miss."""
+    path = os.path.join(cache_dir, key + '.json')
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    # Mark as recently used for LRU eviction
+    os.utime(path)
+    return data['transcript'], [tuple(t) for t in data['timings']]
+
+
+def store_cached_transcript(key, words, timings, cache_dir=TRANSCRIPT_CACHE_DIR,
+                            max_bytes=TRANSCRIPT_CACHE_MAX_BYTES):
+    """Cache (words, timings) under key, evicting least recently used entries past max_bytes."""
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, key + '.json')
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'transcript': words, 'timings': timings}, f)
+    os.replace(tmp_path, path)
+
+    entries = []
+    for name in os.listdir(cache_dir):
+        if name.endswith('.json'):
+            st = os.stat(os.path.join(cache_dir, name))
+            entries.append((st.st_mtime, st.st_size, name))
+    total = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total <= max_bytes:
+            break
+        if name == key + '.json':
+            continue
+        os.unlink(os.path.join(cache_dir, name))
+        total -= size
+
+
+def _transcribe_cached(video_file, parallel=False, workers=None):
+    """Transcribe through the content-addressed cache, running ASR only on a miss."""
+    try:
+        pcm_bytes = b"".join(stream_pcm(video_file))
+    except subprocess.CalledProcessError as e:
+        print(f"Audio conversion failed: {e.stderr.decode()}")
+        return "[Audio extraction failed]", []
+
+    key = transcript_cache_key(pcm_bytes)
+    cached = load_cached_transcript(key)
+    if cached is not None:
+        print(f"Loaded transcript from cache ({key[:12]})")
+        return cached
+
+    if parallel:
+        words, timings = recognize_parallel(np.frombuffer(pcm_bytes, dtype=np.int16), workers)
+    else:
+        words, timings = recognize_chunks(
+            pcm_bytes[i:i + PCM_CHUNK_BYTES] for i in range(0, len(pcm_bytes), PCM_CHUNK_BYTES))
+    store_cached_transcript(key, words, timings)
+    return words, timings
+
+
+def transcribe_audio(video_file, parallel=False, workers=None, use_cache=False):
     """Transcribe audio using Vosk with accurate word timing."""
     print("TRANSCRIBING")
     
@@ -46,77 +412,137 @@ def transcribe_audio(video_file):
         print("Warning: No audio track found in video")
         return "[No speech detected]", []
 
-    # Extract audio to temporary WAV file
-    with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_audio:
-        convert_cmd = [
-            'ffmpeg', '-y', '-i', video_file,
-            '-vn', '-acodec', 'pcm_s16le',
-            '-ar', '16000', '-ac', '1',
-            temp_audio.name
-        ]
-        
-        try:
-            subprocess.run(convert_cmd, check=True, 
-                          stderr=subprocess.PIPE, stdout=subprocess.PIPE)
-        except subprocess.CalledProcessError as e:
-            print(f"Audio conversion failed: {e.stderr.decode()}")
-            return "[Audio extraction failed]", []
-
-    # Transcribe from temporary WAV file
-    model = Model(VOSK_MODEL_PATH)
-    wf = wave.open(temp_audio.name, 'rb')
-    os.unlink(temp_audio.name)
-    
-    rec = KaldiRecognizer(model, wf.getframerate())
-    rec.SetWords(True)
+    if use_cache:
+        return _transcribe_cached(video_file, parallel, workers)
 
-    words = []
-    timings = []
-    last_end_time = 0.0
+    if parallel:
+        return transcribe_audio_parallel(video_file, workers)
 
-    while True:
-        data = wf.readframes(4000)
-        if len(data) == 0:
-            break
-        if rec.AcceptWaveform(data):
-            result = json.loads(rec.Result())
-            if 'result' in result:
-                for word_info in result['result']:
-                    word = word_info['word']
-                    start = round(word_info['start'], 3)
-                    end = round(word_info['end'], 3)
-                    
-                    # Ensure no overlapping timings
-                    if start < last_end_time:
-                        start = last_end_time
-                    if end <= start:
-                        end = start + 0.1  # Minimum duration
-                    
-                    words.append(word)
-                    timings.append((start, end))
-                    last_end_time = end
+    # Recognize while ffmpeg is still decoding
+    try:
+        return recognize_chunks(stream_pcm(video_file))
+    except subprocess.CalledProcessError as e:
+        print(f"Audio conversion failed: {e.stderr.decode()}")
+        return "[Audio extraction failed]", []
 
-    # Process final result
-    final_result = json.loads(rec.FinalResult())
-    if 'result' in final_result:
-        for word_info in final_result['result']:
-            word = word_info['word']
-            start = round(word_info['start'], 3)
-            end = round(word_info['end'], 3)
-            
-            # Ensure no overlapping timings
-            if start < last_end_time:
-                start = last_end_time
+def normalize_word(word):
+    """Lowercase a transcript word and strip the punctuation jsonMp4Creator strips."""
+    return word.lower().strip('.,!?()[]{}":;')
+
+
+def align_transcript(video_file, transcript_words, transcript_timings=None,
+                     model_path=VOSK_MODEL_PATH):
+    """
+    Force-align a known transcript to the audio. The recognizer is restricted
+    to the transcript's vocabulary, recognized words are matched back onto
+    transcript indices, and unmatched words get per-word corrections
+    interpolated from the nearest matched neighbours.
+
+    Grammar restriction needs a model with a dynamic graph (the small
+    en-us models); static-graph models ignore it and decode freely, which
+    still aligns, only slower.
+    """
+    normalized = [normalize_word(w) for w in transcript_words]
+    vocabulary = sorted({w for w in normalized if w}) + ["[unk]"]
+    rec = create_recognizer(VOSK_SAMPLE_RATE, model_path, grammar=vocabulary)
+
+    recognized = []
+    try:
+        for data in stream_pcm(video_file):
+            if rec.AcceptWaveform(data):
+                recognized.extend(json.loads(rec.Result()).get('result', []))
+    except subprocess.CalledProcessError as e:
+        print(f"Audio extraction for alignment failed: {e.stderr.decode()}")
+        return list(transcript_timings) if transcript_timings else []
+    recognized.extend(json.loads(rec.FinalResult()).get('result', []))
+
+    # Map recognized words onto transcript indices
+    matcher = difflib.SequenceMatcher(
+        None, normalized, [r['word'] for r in recognized], autojunk=False)
+    anchors = {}
+    for block in matcher.get_matching_blocks():
+        for k in range(block.size):
+            r = recognized[block.b + k]
+            anchors[block.a + k] = (r['start'], r['end'])
+    print(f"Aligned {len(anchors)}/{len(transcript_words)} transcript words")
+
+    if not anchors:
+        return list(transcript_timings) if transcript_timings else []
+
+    idx = np.array(sorted(anchors))
+    all_idx = np.arange(len(transcript_words))
+    if transcript_timings:
+        # Shift unmatched words by the correction interpolated between anchors
+        orig_starts = np.array([t[0] for t in transcript_timings], dtype=float)
+        orig_ends = np.array([t[1] for t in transcript_timings], dtype=float)
+        corrections = np.interp(all_idx, idx, [anchors[i][0] - orig_starts[i] for i in idx])
+        starts = orig_starts + corrections
+        ends = orig_ends + corrections
+    else:
+        # No prior timings: spread unmatched words evenly between anchors,
+        # and before the first / after the last one at the anchors' average
+        # pace (never before 0) instead of piling them onto the edge anchor
+        anchor_starts = [anchors[i][0] for i in idx]
+        first, last = idx[0], idx[-1]
+        if len(idx) > 1:
+            pace = (anchor_starts[-1] - anchor_starts[0]) / (last - first)
+        else:
+            pace = anchors[first][1] - anchors[first][0]
+        pace = max(pace, 0.1)
+        last_end = anchors[last][1]
+        xs = list(idx) + [last + 1, len(transcript_words) + 1]
+        ys = anchor_starts + [last_end, last_end + (len(transcript_words) - last) * pace]
+        if first > 0:
+            xs.insert(0, 0)
+            ys.insert(0, max(0.0, anchor_starts[0] - first * pace))
+        starts = np.interp(all_idx, xs, ys)
+        ends = np.interp(all_idx + 1, xs, ys)
+
+    aligned = []
+    last_end_time = 0.0
+    for i, (start, end) in enumerate(zip(starts, ends)):
+        if i in anchors:
+            # Recognized words keep their times
+            start, end = anchors[i]
+        else:
+            start = max(float(start), last_end_time)
             if end <= start:
                 end = start + 0.1  # Minimum duration
-            
-            words.append(word)
-            timings.append((start, end))
-            last_end_time = end
+        start, end = round(float(start), 3), round(float(end), 3)
+        aligned.append((start, end))
+        last_end_time = end
+    return aligned
+
+
+# "layered": one MoviePy clip per word state, "overlay": single NumPy pass,
+# "ass": libass burn-in through ffmpeg (process_video_with_captions only)
+CAPTION_RENDERER = "layered"
+# Overlay renderer only: build caption sprites just before their section
+LAZY_CAPTIONS = False
+
+
+def layout_captions(words, timings, width, height):
+    """Group words into sections and lay out every caption word for a width x height frame."""
+    ORIG_H = 808
+    ORIG_OFFSET = 350
+    offset_px = ORIG_OFFSET * height / ORIG_H
+    y_base = height - int(offset_px)
+    current_y = y_base
+
+    # Group words into sections
+    placements = []
+    i = 0
+    while i < len(words):
+        # Choose a random section size between 3 and 5
+        section_size = random.randint(3, 5)
+        section_words = words[i:i+section_size]
+        section_timings = timings[i:i+section_size]
+        layout_section(placements, section_words, section_timings, current_y, width)
+        i += section_size
+    return placements
 
-    return words, timings
 
-def add_captions(video, captions, timings):
+def add_captions(video, captions, timings, renderer=CAPTION_RENDERER, lazy=LAZY_CAPTIONS):
     """
     Add captions to video with precise timing for each word.
     Words are grouped into sections when there's a gap >0.5s between them.
@@ -134,31 +560,24 @@ def add_captions(video, captions, timings):
 
     #shifted = [(start + offset, end + offset) for (start, end) in timings]
 
-    ORIG_H = 808
-    ORIG_OFFSET = 350
-    offset_px = ORIG_OFFSET * height / ORIG_H
-    y_base = height - int(offset_px)
-    current_y = y_base
-
-    current_section = []
-    current_timings = []
-    words = captions.split()
+    placements = layout_captions(captions.split(), timings, width, height)
 
-    # Group words into sections
-    i = 0
-    while i < len(words):
-        # Choose a random section size between 3 and 5
-        section_size = random.randint(3, 5)
-        section_words = words[i:i+section_size]
-        section_timings = timings[i:i+section_size]
-        create_section(clips, section_words, section_timings, current_y, width)
-        i += section_size
+    if renderer == "overlay":
+        print(f"Rendering {len(placements)} caption words in a single overlay pass")
+        return caption_overlay_clip(video, placements, lazy=lazy)
 
+    for placement in placements:
+        create_word_clips(clips, placement)
 
     print(f"Created {len(clips)-1} text sections")
+    stats = raster_cache_stats()
+    print(f"Word raster cache: {stats['hits']} hits, {stats['misses']} misses, "
+          f"{stats['size']} cached")
 
     try:
-        final = CompositeVideoClip(clips)
+        # The base video spans the whole clip; as the background it stays out
+        # of the interval index, which then only scans caption sections
+        final = IndexedCompositeVideoClip(clips, use_bgclip=True)
         if video.audio is not None:
             final = final.with_audio(video.audio)
         print("Successfully composed video with caption sections")
@@ -172,16 +591,12 @@ BOUNCE_FREQUENCY = 10   # Add these constants at the top of your file
 RISE_HEIGHT = 5      # how many pixels the word will rise
 RISE_DURATION = 0.01     # seconds over which the rise happens
 
-def create_section(clips, words, timings, y_pos, screen_width):
+def layout_section(placements, words, timings, y_pos, screen_width):
     """
-    Create a section of words with precise timing for each word's appearance and bounce animation.
-    Each word has exactly three states:
-    1. Normal position (before and after spoken)
-    2. Bounced position (during spoken)
-    3. Shadow for each state
+    Lay out a section of words, appending one WordPlacement per visible word.
+    Sections wider than 80% of the screen are split in half recursively.
     """
     try:
-        FONT_PATH = "Raleway-BoldItalic.ttf"
         font_size = int(screen_width * 0.05)
         PADDING = 20
         MAX_W = screen_width * 0.8
@@ -196,101 +611,80 @@ def create_section(clips, words, timings, y_pos, screen_width):
         section_start = times[0][0]
         section_end = times[-1][1]
 
-        # Build TextClips
-        clips_info = []
+        # Measure words from font metrics, without rasterizing them
+        words_info = []
         for w, (start, end) in zip(texts, times):
-            txt = TextClip(
-                text=w,
-                font=FONT_PATH,
-                font_size=font_size,
-                color="yellow" if len(w) > 5 else "white",
-                stroke_color="black",
-                stroke_width=1,
-                margin=(0, 5),
-            )
-            if txt.w > 0:
-                clips_info.append((txt, (start, end)))
-
-        if not clips_info:
+            color = "yellow" if len(w) > 5 else "white"
+            word_w = measure_word(w, FONT_PATH, font_size)
+            if word_w > 0:
+                words_info.append((w, color, word_w, (start, end)))
+
+        if not words_info:
             return
 
         # Calculate total width and center position
-        total_w = sum(t[0].w for t in clips_info) + PADDING * (len(clips_info) - 1)
+        total_w = sum(t[2] for t in words_info) + PADDING * (len(words_info) - 1)
         if total_w > MAX_W:
-            mid = len(clips_info) // 2
-            create_section(clips, words[:mid], timings[:mid], y_pos, screen_width)
-            create_section(clips, words[mid:], timings[mid:], y_pos, screen_width)
+            mid = len(words_info) // 2
+            layout_section(placements, words[:mid], timings[:mid], y_pos, screen_width)
+            layout_section(placements, words[mid:], timings[mid:], y_pos, screen_width)
             return
 
         x = (screen_width - total_w) / 2
 
-        # Create clips for each word
-        for txt, (w_start, w_end) in clips_info:
+        for w, color, word_w, (w_start, w_end) in words_info:
             x0 = max(0, int(x))
-            x1 = min(screen_width, int(x + txt.w))
-            if x1 <= x0:
-                x += txt.w + PADDING
-                continue
-
-            # Create the three states for each word
-            word_clips = []
-
-            # 1. Normal position (before spoken)
-            word_clips.extend([
-                # Shadow
-                txt.with_position((x0+2, y_pos+2))
-                   .with_start(section_start)
-                   .with_end(w_start)
-                   .with_opacity(0.5),
-                # Text
-                txt.with_position((x0, y_pos))
-                   .with_start(section_start)
-                   .with_end(w_start)
-            ])
-
-            # 2. Bounced position (during spoken)
-            word_clips.extend([
-                # Shadow
-                txt.with_position((x0+2, y_pos-RISE_HEIGHT+2))
-                   .with_start(w_start)
-                   .with_end(w_end)
-                   .with_opacity(0.5),
-                # Glow
-                TextClip(text=txt.text, font=FONT_PATH, font_size=font_size,
-                        color=txt.color, stroke_color="black", stroke_width=1,
-                        margin=(0, 5))
-                   .resized(1.05)
-                   .with_position((x0, y_pos-RISE_HEIGHT))
-                   .with_start(w_start)
-                   .with_end(w_end)
-                   .with_opacity(0.3),
-                # Text
-                txt.with_position((x0, y_pos-RISE_HEIGHT))
-                   .with_start(w_start)
-                   .with_end(w_end)
-            ])
-
-            # 3. Normal position (after spoken)
-            word_clips.extend([
-                # Shadow
-                txt.with_position((x0+2, y_pos+2))
-                   .with_start(w_end)
-                   .with_end(section_end)
-                   .with_opacity(0.5),
-                # Text
-                txt.with_position((x0, y_pos))
-                   .with_start(w_end)
-                   .with_end(section_end)
-            ])
-
-            clips.extend(word_clips)
-            x += txt.w + PADDING
+            x1 = min(screen_width, int(x + word_w))
+            if x1 > x0:
+                placements.append(WordPlacement(
+                    w, FONT_PATH, font_size, color, x0, y_pos, RISE_HEIGHT,
+                    w_start, w_end, section_start, section_end))
+            x += word_w + PADDING
 
     except Exception as e:
         print(f"Error creating section: {e}")
         traceback.print_exc()
 
 
+def create_section(clips, words, timings, y_pos, screen_width):
+    """Lay out a section of words and append the clips for every word to clips."""
+    placements = []
+    layout_section(placements, words, timings, y_pos, screen_width)
+    for placement in placements:
+        create_word_clips(clips, placement)
+
+
+def create_word_clips(clips, p):
+    """
+    Create the clips for one placed word's appearance and bounce animation.
+    Each word has exactly three states, each one pre-baked sprite with its
+    shadow (and glow while spoken) merged in:
+    1. Normal position (before spoken)
+    2. Bounced position (during spoken)
+    3. Normal position (after spoken)
+    """
+    idle = sprite_clip(get_word_sprite(p.text, p.font, p.font_size, p.color))
+    raised = sprite_clip(get_word_sprite(p.text, p.font, p.font_size, p.color, raised=True))
+    x0, y_pos, RISE_HEIGHT = p.x, p.y, p.rise
+
+    word_clips = [
+        # 1. Normal position (before spoken)
+        idle.with_position((x0, y_pos))
+            .with_start(p.section_start)
+            .with_end(p.start),
+        # 2. Bounced position (during spoken)
+        raised.with_position((x0, y_pos-RISE_HEIGHT))
+              .with_start(p.start)
+              .with_end(p.end),
+        # 3. Normal position (after spoken)
+        idle.with_position((x0, y_pos))
+            .with_start(p.end)
+            .with_end(p.section_end),
+    ]
+
+    clips.extend(word_clips)
+
+
 def load_transcript_json(json_path):
     """Load transcript data from JSON file."""
     try:
@@ -301,27 +695,74 @@ def load_transcript_json(json_path):
         return None
 
 
-def process_video_with_captions(input_path, output_path, duration=10):
+def probe_video_size(video_file):
+    """Return (width, height) of the first video stream using ffprobe."""
+    probe_cmd = [
+        'ffprobe', '-v', 'error', '-select_streams', 'v:0',
+        '-show_entries', 'stream=width,height', '-of', 'csv=p=0', video_file
+    ]
+    width, height = subprocess.check_output(probe_cmd).decode().strip().split(',')[:2]
+    return int(width), int(height)
+
+
+def burn_in_ass_captions(input_path, output_path, words, timings, duration):
+    """
+    Render the first `duration` seconds of input_path with captions burned in
+    by ffmpeg's ass filter, in a single decode/encode pass. Python only
+    writes the subtitle script.
+    """
+    width, height = probe_video_size(input_path)
+    placements = layout_captions(words, timings, width, height)
+
+    with tempfile.NamedTemporaryFile(suffix=".ass", delete=False) as tmp:
+        ass_path = tmp.name
+    try:
+        write_ass_captions(placements, ass_path, width, height)
+        fonts_dir = os.path.dirname(os.path.abspath(FONT_PATH))
+        cmd = [
+            'ffmpeg', '-y', '-v', 'error',
+            '-t', str(duration), '-i', input_path,
+            '-vf', f"ass='{ffmpeg_filter_path(ass_path)}':fontsdir='{ffmpeg_filter_path(fonts_dir)}'",
+            '-c:v', 'libx264', '-c:a', 'copy',
+            output_path
+        ]
+        print(f"Burning in {len(placements)} caption words with ffmpeg")
+        subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    finally:
+        os.unlink(ass_path)
+
+
+def process_video_with_captions(input_path, output_path, duration=10, renderer=CAPTION_RENDERER,
+                                audio_passthrough=True, pretrim=True, pipelined=True):
     """Process video with captions and create a clip of specified duration."""
     try:
         # Load transcript data
         transcript_path = input_path.replace('.mp4', '.json')
+        from_json = False
         try:
             with open(transcript_path, 'r', encoding='utf-8') as f:
                 data = json.load(f)
                 words = data['transcript']
                 timings = data['timings']
+                from_json = True
                 print("Loaded transcript from JSON file")
         except (FileNotFoundError, json.JSONDecodeError) as e:
             print(f"Could not load JSON transcript: {e}")
             print("Falling back to Vosk transcription...")
-            words, timings = transcribe_audio(input_path)
+            words, timings = transcribe_audio(input_path, use_cache=True)
             print("Completed Vosk transcription")
         
+        USE_FORCED_ALIGNMENT = False
         USE_STATIC_OFFSET = False
         STATIC_OFFSET = -0.4
-        if not USE_STATIC_OFFSET:
-            dyn_offset = estimate_dynamic_offset(input_path, timings)
+        REFINE_OFFSET_WITH_VOSK = False
+        if USE_FORCED_ALIGNMENT and from_json:
+            # Per-word corrections replace the single offset
+            timings = align_transcript(input_path, words, timings)
+            dyn_offset = 0.0
+        elif not USE_STATIC_OFFSET:
+            dyn_offset = estimate_sync_offset(input_path, timings,
+                                              refine_with_vosk=REFINE_OFFSET_WITH_VOSK)
         else:
             dyn_offset = STATIC_OFFSET
 
@@ -330,76 +771,162 @@ def process_video_with_captions(input_path, output_path, duration=10):
             (max(0, start + dyn_offset), end + dyn_offset)
             for start, end in timings
         ]
-        # Create video clip
-        video = VideoFileClip(input_path)
-        clip = video.subclipped(0, duration)
+        if renderer == "ass":
+            kept = [(w, t) for w, t in zip(words, adjusted_timings) if t[0] < duration]
+            burn_in_ass_captions(input_path, output_path,
+                                 [w for w, _ in kept], [t for _, t in kept], duration)
+            return
+
+        # Create video clip, from a small pre-trimmed copy of the window if enabled
+        trimmed_path = pretrim_source(input_path, 0, duration) if pretrim else None
+        video = None
+        try:
+            video = VideoFileClip(trimmed_path or input_path)
+            clip = video.subclipped(0, min(duration, video.duration))
         
-        # Filter transcript and timings to only include words within the clip duration
-        filtered_words = []
-        filtered_timings = []
+            # Filter transcript and timings to only include words within the clip duration
+            filtered_words = []
+            filtered_timings = []
         
-        for word, timing in zip(words, adjusted_timings):
-            if timing[0] < duration:
-                filtered_words.append(word)
-                filtered_timings.append(timing)
+            for word, timing in zip(words, adjusted_timings):
+                if timing[0] < duration:
+                    filtered_words.append(word)
+                    filtered_timings.append((timing[0], min(timing[1], duration)))
 
-        # Now pass the filtered, adjusted timings into add_captions
-        captions = add_captions(clip, " ".join(filtered_words), filtered_timings)
+            # Now pass the filtered, adjusted timings into add_captions
+            captions = add_captions(clip, " ".join(filtered_words), filtered_timings, renderer)
         
-        # Add captions to video
-        final_video = CompositeVideoClip([clip, captions])
+            # Add captions to video, without blending the base clip twice
+            final_video = flatten_composition(
+                CompositeVideoClip([clip, captions]).with_duration(clip.duration),
+                IndexedCompositeVideoClip)
         
-        # Write output
-        final_video.write_videofile(output_path, codec='libx264', audio_codec='aac')
+            # Write output; captions don't touch the audio, so it can be stream-copied
+            if audio_passthrough:
+                write_with_audio_passthrough(final_video, output_path, input_path,
+                                             0, duration, pipelined=pipelined, codec='libx264')
+            elif pipelined:
+                write_pipelined(final_video, output_path, codec='libx264')
+            else:
+                final_video.write_videofile(output_path, codec='libx264', audio_codec='aac')
+            index = getattr(final_video, 'interval_index', None)
+            if index is not None:
+                print(f"Caption clips visited per frame: {index.mean_visited():.1f} "
+                      f"(of {len(index.items)})")
+            live_stats = getattr(final_video, 'live_stats', None)
+            if live_stats:
+                print(f"Lazy captions: built {live_stats['built']} words, "
+                      f"at most {live_stats['peak_live']} held at once")
+            band_stats = getattr(final_video, 'band_stats', None)
+            if band_stats and band_stats['frame_pixels']:
+                print(f"Caption band covered {band_stats['band_pixels'] / band_stats['frame_pixels']:.1%} "
+                      f"of captioned frame pixels")
         
-        # Cleanup
-        video.close()
-        final_video.close()
+            # Cleanup
+            final_video.close()
+        finally:
+            # Also reached when rendering fails, so the temp copy never leaks
+            if video is not None:
+                video.close()
+            if trimmed_path and os.path.exists(trimmed_path):
+                os.remove(trimmed_path)
         
     except Exception as e:
         print(f"Error processing video: {str(e)}")
         raise
 
+ENVELOPE_HOP = 0.01          # seconds per envelope sample
+OFFSET_WINDOW = 60.0         # seconds of audio analysed for sync
+MAX_SYNC_SHIFT = 2.0         # largest offset considered, in seconds
+VOSK_REFINE_TOLERANCE = 0.3  # seconds Vosk may disagree with the energy estimate
+
+
+def speech_envelope(timings, length, hop=ENVELOPE_HOP):
+    """Binary speech-activity envelope (length samples) built from word timings."""
+    envelope = np.zeros(length, dtype=np.float32)
+    for start, end in timings:
+        i0 = max(0, int(start / hop))
+        i1 = min(length, int(np.ceil(end / hop)))
+        if i1 > i0:
+            envelope[i0:i1] = 1.0
+    return envelope
+
+
+def estimate_energy_offset_ms(video_file, transcript_timings, window=OFFSET_WINDOW,
+                              hop=ENVELOPE_HOP, max_shift=MAX_SYNC_SHIFT):
+    """
+    Estimate the transcript-to-audio offset in milliseconds, without loading
+    a model, by cross-correlating the transcript's speech-activity envelope
+    with the RMS envelope of the first `window` seconds of audio, read from
+    the source's loudness sidecar.
+    """
+    try:
+        audio_env, _, hop = rms_envelope(video_file, hop, duration=window)
+    except subprocess.CalledProcessError as e:
+        print(f"Audio extraction for sync failed: {e.stderr.decode()}")
+        return 0.0
+
+    speech_env = speech_envelope(transcript_timings, len(audio_env), hop)
+    if len(audio_env) == 0 or not speech_env.any() or audio_env.std() == 0:
+        return 0.0
+
+    audio_env = (audio_env - audio_env.mean()) / audio_env.std()
+    speech_env = speech_env - speech_env.mean()
+
+    # corr[n - 1 + lag] scores audio shifted `lag` hops later than the transcript
+    corr = np.correlate(audio_env, speech_env, mode='full')
+    center = len(speech_env) - 1
+    max_lag = min(int(max_shift / hop), center)
+    lags = np.arange(-max_lag, max_lag + 1)
+    best_lag = lags[np.argmax(corr[center - max_lag:center + max_lag + 1])]
+    return round(float(best_lag * hop * 1000), 3)
+
+
+def estimate_sync_offset(video_file, transcript_timings, refine_with_vosk=False,
+                         vosk_model_path=VOSK_MODEL_PATH):
+    """
+    Offset in seconds to add to transcript_timings. Uses the energy
+    cross-correlation estimate, optionally refined by Vosk's first word
+    when the two agree within VOSK_REFINE_TOLERANCE.
+    """
+    offset = estimate_energy_offset_ms(video_file, transcript_timings) / 1000
+    print(f"Energy sync offset: {offset:.3f}s")
+    if refine_with_vosk:
+        vosk_offset = estimate_dynamic_offset(video_file, transcript_timings, vosk_model_path)
+        if abs(vosk_offset - offset) <= VOSK_REFINE_TOLERANCE:
+            print(f"Refined sync offset with Vosk: {vosk_offset:.3f}s")
+            offset = vosk_offset
+    return offset
+
+
 def estimate_dynamic_offset(video_file, transcript_timings, vosk_model_path=VOSK_MODEL_PATH):
     """
     Compute a dynamic offset by comparing the first word
     timestamp from the existing transcript_timings vs.
     VOSK's own detection on the video audio.
     """
-    # 1) Extract audio to WAV
-    with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp:
-        ffmpeg_cmd = [
-            'ffmpeg','-y','-i', video_file,
-            '-vn','-acodec','pcm_s16le','-ar','16000','-ac','1', tmp.name
-        ]
-        subprocess.run(ffmpeg_cmd, check=True,
-                       stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        wav_path = tmp.name
-
-    # 2) Run VOSK recognizer
-    wf = wave.open(wav_path, 'rb')
-    os.unlink(wav_path)
-    model = Model(vosk_model_path)
-    rec = KaldiRecognizer(model, wf.getframerate())
-    rec.SetWords(True)
+    # 1) Run VOSK recognizer on the decoded audio as it streams in
+    rec = create_recognizer(VOSK_SAMPLE_RATE, vosk_model_path)
 
     first_vosk_start = None
-    while True:
-        data = wf.readframes(4000)
-        if not data:
-            break
-        if rec.AcceptWaveform(data):
-            res = json.loads(rec.Result())
-            if 'result' in res and res['result']:
-                first_vosk_start = round(res['result'][0]['start'], 3)
-                break
+    pcm = stream_pcm(video_file)
+    try:
+        for data in pcm:
+            if rec.AcceptWaveform(data):
+                res = json.loads(rec.Result())
+                if 'result' in res and res['result']:
+                    first_vosk_start = round(res['result'][0]['start'], 3)
+                    break
+    finally:
+        # Stops ffmpeg once the first word is found
+        pcm.close()
     if first_vosk_start is None:
         # Fall back to final chunk if nothing yet
         final = json.loads(rec.FinalResult())
         if 'result' in final and final['result']:
             first_vosk_start = round(final['result'][0]['start'], 3)
 
-    # 3) Compare to your transcript_timings[0][0]
+    # 2) Compare to your transcript_timings[0][0]
     if first_vosk_start is not None and transcript_timings:
         original_start = transcript_timings[0][0]
         print(first_vosk_start)
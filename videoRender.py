@@ -0,0 +1,657 @@
+import json
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+import numpy as np
+from moviepy import CompositeVideoClip, CompositeAudioClip
+from moviepy.video.io.ffmpeg_writer import FFMPEG_VideoWriter
+
+
+def _is_origin(clip):
+    """True if clip is positioned at the top-left corner."""
+    pos = clip.pos(0)
+    return tuple(pos) == (0, 0)
+
+
+def _covers(layer, size, duration, below=()):
+    """
+    True if layer is opaque and hides everything below it: it starts with the
+    clip and runs to the clip's end, or at least as long as every layer in
+    `below` (a base clip that stops where its source does, under captions
+    that outlast it).
+    """
+    if not (layer.mask is None
+            and tuple(layer.size) == tuple(size)
+            and _is_origin(layer)
+            and layer.start <= 0):
+        return False
+    if layer.end is None or duration is None or layer.end >= duration:
+        return True
+    return bool(below) and all(lower.end is not None and lower.end <= layer.end
+                               for lower in below)
+
+
+def _inline_layers(composite):
+    """
+    Layers of a composite in drawing order, with nested full-size composites
+    at the origin replaced by their own layers.
+    """
+    layers = []
+    if not composite.created_bg:
+        layers.append(composite.bg)
+    elif composite.mask is None:
+        # Opaque background colour the composite created itself
+        layers.append(composite.bg)
+    for layer in composite.clips:
+        if (isinstance(layer, CompositeVideoClip)
+                and tuple(layer.size) == tuple(composite.size)
+                and _is_origin(layer)
+                and layer.start == 0
+                and (layer.end is None or composite.duration is None
+                     or layer.end >= composite.duration)):
+            layers.extend(_inline_layers(layer))
+        else:
+            layers.append(layer)
+    return layers
+
+
+def _audio_leaves(audio):
+    """Clips mixed into audio, with nested composites that start at 0 expanded."""
+    if audio is None:
+        return []
+    if isinstance(audio, CompositeAudioClip) and not audio.start:
+        leaves = []
+        for child in audio.clips:
+            leaves.extend(_audio_leaves(child))
+        return leaves
+    return [audio]
+
+
+def flatten_composition(clip, composite_class=CompositeVideoClip):
+    """
+    Normalize a composition graph before rendering: nested full-size
+    composites are inlined into one layer stack, and every layer hidden
+    under a later full-frame opaque layer (such as a base clip that a nested
+    composite repeats) is dropped, so each frame decodes and blends it once.
+
+    The result's audio mixes each distinct audio source of the original
+    composition once, including audio set on nested composites. Clips that are not composites, or whose layers use
+    explicit layer indexes, are returned unchanged.
+    """
+    if not isinstance(clip, CompositeVideoClip):
+        return clip
+
+    layers = _inline_layers(clip)
+    if any(getattr(layer, 'layer_index', 0) != 0 for layer in layers):
+        return clip
+
+    # Everything below the topmost covering layer is never visible
+    top = 0
+    for i, layer in enumerate(layers):
+        if _covers(layer, clip.size, clip.duration, layers[:i]):
+            top = i
+    kept = layers[top:]
+    removed = len(layers) - len(kept)
+
+    # Copies of a clip (clip.copy(), with_duration, ...) carry copies of its
+    # audio that still share the source's frame function, so dedupe on that
+    audios = []
+    seen = set()
+    for audio in _audio_leaves(clip.audio):
+        key = (id(audio.frame_function), audio.start, audio.duration)
+        if key not in seen:
+            seen.add(key)
+            audios.append(audio)
+
+    if len(kept) == 1 and _covers(kept[0], clip.size, clip.duration):
+        flat = kept[0]
+    else:
+        flat = composite_class(kept, size=clip.size,
+                               use_bgclip=_covers(kept[0], clip.size, clip.duration))
+    if clip.duration is not None:
+        flat = flat.with_duration(clip.duration)
+    if audios:
+        flat = flat.with_audio(audios[0] if len(audios) == 1 else CompositeAudioClip(audios))
+
+    print(f"Flattened composition: removed {removed} hidden layers, {len(kept)} left")
+    return flat
+
+
+def mux_audio_passthrough(video_path, audio_source, output_path, start=0.0, duration=None):
+    """
+    Mux the video stream of video_path with the original compressed audio
+    of audio_source (trimmed to start/duration) using stream copy only.
+    Sources without audio just get their video stream copied.
+    """
+    cmd = ['ffmpeg', '-y', '-v', 'error', '-i', video_path]
+    if start:
+        cmd += ['-ss', str(start)]
+    if duration is not None:
+        cmd += ['-t', str(duration)]
+    cmd += [
+        '-i', audio_source,
+        '-map', '0:v:0', '-map', '1:a:0?',
+        '-c', 'copy', '-shortest',
+        output_path
+    ]
+    subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+def write_with_audio_passthrough(clip, output_path, audio_source, start=0.0, duration=None,
+                                 pipelined=False, **write_kwargs):
+    """
+    Render clip's frames without audio, then stream-copy the untouched audio
+    of audio_source into the result. Skips the PCM decode, temp audio file
+    and AAC re-encode of write_videofile when a stage does not change audio.
+    With pipelined=True the frames are rendered by render_pipelined.
+    """
+    base, ext = os.path.splitext(output_path)
+    video_only = f"{base}.video-only{ext or '.mp4'}"
+    try:
+        if pipelined:
+            render_pipelined(clip, video_only, **write_kwargs)
+        else:
+            clip.write_videofile(video_only, audio=False, **write_kwargs)
+        mux_audio_passthrough(video_only, audio_source, output_path, start, duration)
+    finally:
+        if os.path.exists(video_only):
+            os.remove(video_only)
+    return output_path
+
+
+def probe_keyframes(video_file, start, end):
+    """Timestamps of the video keyframes between start and end seconds."""
+    cmd = [
+        'ffprobe', '-v', 'error', '-select_streams', 'v:0',
+        '-skip_frame', 'nokey', '-show_entries', 'frame=pts_time',
+        '-read_intervals', f"{start}%{end}", '-of', 'csv=p=0', video_file
+    ]
+    output = subprocess.check_output(cmd).decode()
+    times = []
+    for line in output.split():
+        try:
+            times.append(float(line.strip(',')))
+        except ValueError:
+            continue
+    return sorted(t for t in times if start <= t <= end)
+
+
+KEYFRAME_TOLERANCE = 0.001   # seconds within which start counts as on a keyframe
+
+
+def concat_stream_copy(parts, output_path):
+    """Join files with identical stream parameters via ffmpeg's concat demuxer, without re-encoding."""
+    list_path = output_path + '.concat.txt'
+    try:
+        with open(list_path, 'w') as f:
+            for part in parts:
+                escaped = os.path.abspath(part).replace("'", "'\\''")
+                f.write(f"file '{escaped}'\n")
+        subprocess.run([
+            'ffmpeg', '-y', '-v', 'error', '-f', 'concat', '-safe', '0', '-i', list_path,
+            '-c', 'copy', output_path
+        ], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    finally:
+        if os.path.exists(list_path):
+            os.remove(list_path)
+    return output_path
+
+
+# ffprobe profile names of H.264 streams libx264 can reproduce
+X264_PROFILES = {
+    'Constrained Baseline': 'baseline',
+    'Baseline': 'baseline',
+    'Main': 'main',
+    'High': 'high',
+    'High 10': 'high10',
+    'High 4:2:2': 'high422',
+    'High 4:4:4 Predictive': 'high444',
+}
+X264_PIX_FMTS = {
+    'yuv420p', 'yuvj420p', 'yuv422p', 'yuvj422p', 'yuv444p', 'yuvj444p',
+    'yuv420p10le', 'yuv422p10le', 'yuv444p10le',
+}
+
+
+def probe_video_stream(video_file):
+    """codec_name, profile, pix_fmt and time_base of the first video stream ({} if unknown)."""
+    cmd = [
+        'ffprobe', '-v', 'error', '-select_streams', 'v:0',
+        '-show_entries', 'stream=codec_name,profile,pix_fmt,time_base',
+        '-of', 'json', video_file
+    ]
+    try:
+        output = subprocess.check_output(cmd, stderr=subprocess.PIPE).decode()
+        streams = json.loads(output).get('streams') or [{}]
+    except (subprocess.CalledProcessError, OSError, ValueError):
+        return {}
+    return streams[0]
+
+
+def probe_duration(video_file, stream='v:0'):
+    """Duration in seconds of one stream of video_file (the container's if the stream has none)."""
+    cmd = [
+        'ffprobe', '-v', 'error', '-select_streams', stream,
+        '-show_entries', 'stream=duration:format=duration', '-of', 'json', video_file
+    ]
+    info = json.loads(subprocess.check_output(cmd, stderr=subprocess.PIPE).decode())
+    for entry in (info.get('streams') or [{}])[0], info.get('format', {}):
+        try:
+            return float(entry['duration'])
+        except (KeyError, ValueError):
+            continue
+    raise ValueError(f"No duration for stream {stream} of {video_file}")
+
+
+def timescale_args(stream):
+    """-video_track_timescale matching the source track, so concatenated pieces share a time base."""
+    num, _, den = stream.get('time_base', '').partition('/')
+    if num == '1' and den.isdigit():
+        return ['-video_track_timescale', den]
+    return []
+
+
+def matching_encode_args(stream):
+    """
+    libx264 arguments whose output can be concat-copied next to GOPs
+    stream-copied from the probed source stream, or None when the source is
+    not H.264 in a profile and pixel format libx264 can reproduce.
+    """
+    profile = X264_PROFILES.get(stream.get('profile'))
+    pix_fmt = stream.get('pix_fmt')
+    if stream.get('codec_name') != 'h264' or profile is None or pix_fmt not in X264_PIX_FMTS:
+        return None
+    return ['-c:v', 'libx264', '-pix_fmt', pix_fmt, '-profile:v', profile, *timescale_args(stream)]
+
+
+def smart_cut(input_path, start, end, output_path, with_audio=True, stream=None):
+    """
+    Cut [start, end) of input_path into output_path. Everything from the
+    first keyframe at or after start is stream-copied; only the partial GOP
+    before it is re-encoded, with the source's codec settings. Sources
+    libx264 cannot match are re-encoded for the whole window instead.
+    Audio, when kept, is stream-copied for the whole window. stream is
+    probe_video_stream(input_path), probed here when not given.
+    """
+    duration = end - start
+    audio_map = ['-map', '0:a:0?'] if with_audio else ['-an']
+    if stream is None:
+        stream = probe_video_stream(input_path)
+    encode_args = matching_encode_args(stream)
+
+    keyframes = probe_keyframes(input_path, start, end)
+    if keyframes and keyframes[0] - start <= KEYFRAME_TOLERANCE:
+        # Window starts on a keyframe: plain stream copy
+        subprocess.run([
+            'ffmpeg', '-y', '-v', 'error', '-ss', str(start), '-i', input_path,
+            '-t', str(duration), '-map', '0:v:0', *audio_map, '-c', 'copy',
+            output_path
+        ], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        return output_path
+
+    if not keyframes or encode_args is None:
+        # Nothing to copy, or copied GOPs could not be joined to a re-encoded
+        # head without corrupting the stream: re-encode it all
+        subprocess.run([
+            'ffmpeg', '-y', '-v', 'error', '-ss', str(start), '-i', input_path,
+            '-t', str(duration), '-map', '0:v:0', *audio_map,
+            *(encode_args or ['-c:v', 'libx264']), '-c:a', 'copy', output_path
+        ], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        return output_path
+
+    first_key = keyframes[0]
+    work_dir = tempfile.mkdtemp()
+    head = os.path.join(work_dir, 'head.mp4')
+    tail = os.path.join(work_dir, 'tail.mp4')
+    video = os.path.join(work_dir, 'video.mp4')
+    try:
+        # Re-encode the partial GOP up to the first keyframe
+        subprocess.run([
+            'ffmpeg', '-y', '-v', 'error', '-ss', str(start), '-i', input_path,
+            '-t', str(first_key - start), '-map', '0:v:0', *encode_args, head
+        ], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        # Stream-copy whole GOPs from the keyframe to the end of the window
+        subprocess.run([
+            'ffmpeg', '-y', '-v', 'error', '-ss', str(first_key), '-i', input_path,
+            '-t', str(end - first_key), '-map', '0:v:0', '-c', 'copy',
+            *timescale_args(stream), tail
+        ], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if with_audio:
+            concat_stream_copy([head, tail], video)
+            mux_audio_passthrough(video, input_path, output_path, start, duration)
+        else:
+            concat_stream_copy([head, tail], output_path)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return output_path
+
+
+def pretrim_source(input_path, start, end, output_path=None):
+    """
+    Cut the [start, end) window out of input_path into a small local file
+    that MoviePy can open cheaply, with smart_cut.
+    """
+    if output_path is None:
+        ext = os.path.splitext(input_path)[1] or '.mp4'
+        with tempfile.NamedTemporaryFile(suffix=ext, delete=False) as tmp:
+            output_path = tmp.name
+    return smart_cut(input_path, start, end, output_path)
+
+
+RENDER_RING_SIZE = 8   # frame buffers between each pair of render stages
+
+
+class ZeroCopyVideoWriter(FFMPEG_VideoWriter):
+    """
+    FFMPEG_VideoWriter that hands frames to the ffmpeg pipe through a
+    memoryview instead of tobytes(). Frames that are already contiguous
+    uint8 RGB of the output size (e.g. render_pipelined's ring buffers) are
+    written as-is; anything else is copied into one reused scratch buffer.
+    `stats` counts frames, copies and buffer allocations.
+    """
+
+    def __init__(self, filename, size, fps, **kwargs):
+        super().__init__(filename, size, fps, **kwargs)
+        self.size = tuple(size)
+        self.scratch = None
+        self.stats = {'frames': 0, 'copies': 0, 'allocations': 0, 'bytes': 0}
+
+    def write_frame(self, img_array):
+        frame = img_array
+        width, height = self.size
+        if (frame.dtype != np.uint8 or frame.shape != (height, width, 3)
+                or not frame.flags.c_contiguous):
+            if self.scratch is None:
+                self.scratch = np.empty((height, width, 3), dtype=np.uint8)
+                self.stats['allocations'] += 1
+            np.copyto(self.scratch, frame[:, :, :3], casting='unsafe')
+            self.stats['copies'] += 1
+            frame = self.scratch
+        try:
+            self.proc.stdin.write(memoryview(frame).cast('B'))
+        except IOError as err:
+            _, ffmpeg_error = self.proc.communicate()
+            ffmpeg_error = ffmpeg_error.decode() if ffmpeg_error else ""
+            raise IOError(f"{err}\n\nffmpeg failed writing {self.filename}:\n\n{ffmpeg_error}")
+        self.stats['frames'] += 1
+        self.stats['bytes'] += frame.nbytes
+
+
+READ_AHEAD_MAX_SKIP = 100   # frames a request may jump ahead before it counts as a seek
+
+
+class ReadAheadReader:
+    """
+    Decodes the frames of one FFMPEG_VideoReader ahead of the compositor on
+    a reader thread, so ffmpeg keeps decoding while Python composites.
+    While started it stands in for reader.get_frame (shared by every copy
+    of the VideoFileClip): requests that move forward are served from a
+    queue of at most `depth` frames, and seeks (back, or more than
+    READ_AHEAD_MAX_SKIP frames ahead) stop the thread, seek with the
+    reader's own get_frame and read ahead again from there. `stats` is
+    [frames, seconds] spent decoding.
+    """
+
+    def __init__(self, reader, depth=RENDER_RING_SIZE):
+        self.reader = reader
+        self.depth = depth
+        self.stats = [0, 0.0]
+        self.get_frame_direct = reader.get_frame
+        self.thread = None
+        self.frames = None
+        self.stopping = False
+        self.error = None
+        self.pos, self.frame = None, None
+
+    def start(self):
+        self.reader.get_frame = self.get_frame
+        self._spawn()
+
+    def stop(self):
+        self._halt()
+        del self.reader.get_frame
+
+    def _spawn(self):
+        reader = self.reader
+        if not reader.proc or reader.pos >= reader.n_frames:
+            return
+        self.pos, self.frame = reader.pos, getattr(reader, 'last_read', None)
+        self.frames = queue.Queue(self.depth)
+        self.stopping = False
+        self.thread = threading.Thread(target=self._read, daemon=True)
+        self.thread.start()
+
+    def _halt(self):
+        if self.thread is None:
+            return
+        self.stopping = True
+        while self.thread.is_alive():
+            # Unblock a put on a full queue
+            try:
+                self.frames.get(timeout=0.01)
+            except queue.Empty:
+                pass
+        self.thread = None
+
+    def _read(self):
+        reader = self.reader
+        try:
+            while not self.stopping and reader.pos < reader.n_frames:
+                start = time.perf_counter()
+                frame = reader.read_frame()
+                self.stats[0] += 1
+                self.stats[1] += time.perf_counter() - start
+                self.frames.put((reader.pos, frame))
+        except Exception as e:
+            self.error = e
+        finally:
+            self.frames.put(None)
+
+    def get_frame(self, t):
+        pos = self.reader.get_frame_number(t) + 1
+        if self.thread is not None and self.pos <= pos <= self.pos + READ_AHEAD_MAX_SKIP:
+            while self.pos < pos:
+                item = self.frames.get()
+                if item is None:
+                    break
+                self.pos, self.frame = item
+            if self.pos == pos and self.frame is not None:
+                return self.frame
+        # Seek, end of stream or a failed read: go through the reader itself
+        self._halt()
+        if self.error is not None:
+            raise self.error
+        frame = self.get_frame_direct(t)
+        self._spawn()
+        return frame
+
+
+def _file_readers(clip):
+    """The distinct ffmpeg video readers of the VideoFileClips in clip's layer tree."""
+    readers = []
+    stack = [clip]
+    seen = set()
+    while stack:
+        node = stack.pop()
+        if node is None or id(node) in seen:
+            continue
+        seen.add(id(node))
+        reader = getattr(node, 'reader', None)
+        if hasattr(reader, 'read_frame') and all(reader is not r for r in readers):
+            readers.append(reader)
+        if isinstance(node, CompositeVideoClip):
+            stack.extend(node.clips)
+            stack.append(node.bg)
+    return readers
+
+
+def _stage_fps(stats, stage):
+    frames, busy = stats[stage]
+    return frames / busy if busy else float('inf')
+
+
+def render_pipelined(clip, output_path, fps=None, codec='libx264', preset='medium',
+                     threads=None, ffmpeg_params=None, ring_size=RENDER_RING_SIZE):
+    """
+    Render clip's frames (no audio) with decoding, compositing and encoding
+    as separate stages joined by bounded rings of preallocated frame buffers,
+    so Python compositing overlaps with ffmpeg decoding and encoding.
+
+    Clips that expose `pipeline_stages = (source, transform, frame_function)`
+    (see captionRenderer.caption_overlay_clip) are decoded from source on a
+    reader thread and composited with transform(get_frame, t), as long as
+    clip.frame_function is still that frame_function; clips derived from
+    them (subclipped, resized, ...) and all other clips are composited by
+    clip.get_frame, while the VideoFileClips in their layer tree are
+    decoded ahead on reader threads (ReadAheadReader). Frames/sec of every
+    stage is printed at the end.
+    """
+    fps = fps or clip.fps
+    n_frames = int(clip.duration * fps)
+    width, height = clip.size
+    source, transform = None, None
+    stages = getattr(clip, 'pipeline_stages', None)
+    if stages is not None and clip.frame_function is stages[2]:
+        source, transform = stages[:2]
+    stats = {'decode': [0, 0.0], 'composite': [0, 0.0], 'encode': [0, 0.0]}
+    ring_copies = 0
+    errors = []
+
+    out_ring = [np.empty((height, width, 3), dtype=np.uint8) for _ in range(ring_size)]
+    free_out, full_out = queue.Queue(), queue.Queue()
+    for slot in range(ring_size):
+        free_out.put(slot)
+
+    if source is not None:
+        source_w, source_h = source.size
+        in_ring = [np.empty((source_h, source_w, 3), dtype=np.uint8) for _ in range(ring_size)]
+        free_in, full_in = queue.Queue(), queue.Queue()
+        for slot in range(ring_size):
+            free_in.put(slot)
+
+    def decode():
+        try:
+            for i in range(n_frames):
+                slot = free_in.get()
+                if slot is None:
+                    return
+                start = time.perf_counter()
+                np.copyto(in_ring[slot], source.get_frame(i / fps), casting='unsafe')
+                stats['decode'][0] += 1
+                stats['decode'][1] += time.perf_counter() - start
+                full_in.put(slot)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            full_in.put(None)
+
+    writer = ZeroCopyVideoWriter(output_path, clip.size, fps, codec=codec, preset=preset,
+                                 threads=threads, ffmpeg_params=ffmpeg_params)
+    read_ahead = []
+    if source is None:
+        read_ahead = [ReadAheadReader(reader, ring_size) for reader in _file_readers(clip)]
+
+    def encode():
+        failed = False
+        while True:
+            slot = full_out.get()
+            if slot is None:
+                return
+            if not failed:
+                try:
+                    start = time.perf_counter()
+                    writer.write_frame(out_ring[slot])
+                    stats['encode'][0] += 1
+                    stats['encode'][1] += time.perf_counter() - start
+                except Exception as e:
+                    # Keep draining so the compositor never blocks on a full ring
+                    errors.append(e)
+                    failed = True
+            free_out.put(slot)
+
+    threads_started = [threading.Thread(target=encode, daemon=True)]
+    if source is not None:
+        threads_started.append(threading.Thread(target=decode, daemon=True))
+    for thread in threads_started:
+        thread.start()
+    for reader in read_ahead:
+        reader.start()
+
+    wall_start = time.perf_counter()
+    try:
+        for i in range(n_frames):
+            if errors:
+                break
+            t = i / fps
+            if source is not None:
+                in_slot = full_in.get()
+                if in_slot is None:
+                    break
+                start = time.perf_counter()
+                frame = transform(lambda _t, s=in_slot: in_ring[s], t)
+            else:
+                start = time.perf_counter()
+                frame = clip.get_frame(t)
+            out_slot = free_out.get()
+            if frame is not out_ring[out_slot]:
+                np.copyto(out_ring[out_slot], frame, casting='unsafe')
+                ring_copies += 1
+            if source is not None:
+                free_in.put(in_slot)
+            stats['composite'][0] += 1
+            stats['composite'][1] += time.perf_counter() - start
+            full_out.put(out_slot)
+    finally:
+        if source is not None:
+            free_in.put(None)
+        full_out.put(None)
+        for reader in read_ahead:
+            reader.stop()
+        for thread in threads_started:
+            thread.join()
+        writer.close()
+    for reader in read_ahead:
+        stats['decode'][0] += reader.stats[0]
+        stats['decode'][1] += reader.stats[1]
+
+    if errors:
+        raise errors[0]
+
+    wall = time.perf_counter() - wall_start
+    stage_rates = ", ".join(
+        f"{stage} {_stage_fps(stats, stage):.1f} fps" for stage in stats if stats[stage][0])
+    print(f"Rendered {n_frames} frames in {wall:.1f}s ({n_frames / wall if wall else 0:.1f} fps): "
+          f"{stage_rates}")
+    per_frame = max(writer.stats['frames'], 1)
+    print(f"Frame handoff: {ring_copies / per_frame:.2f} ring copies/frame, "
+          f"{writer.stats['copies'] / per_frame:.2f} writer copies/frame, "
+          f"{writer.stats['allocations']} writer allocations, "
+          f"{writer.stats['bytes'] / 1e6:.0f} MB piped")
+    return output_path
+
+
+def write_pipelined(clip, output_path, audio_codec='aac', **render_kwargs):
+    """
+    render_pipelined, plus the clip's own (edited) audio encoded once and
+    stream-copied into the result.
+    """
+    if clip.audio is None:
+        return render_pipelined(clip, output_path, **render_kwargs)
+
+    base, ext = os.path.splitext(output_path)
+    video_only = f"{base}.video-only{ext or '.mp4'}"
+    audio_only = f"{base}.audio-only.m4a"
+    try:
+        render_pipelined(clip, video_only, **render_kwargs)
+        clip.audio.write_audiofile(audio_only, codec=audio_codec, logger=None)
+        mux_audio_passthrough(video_only, audio_only, output_path)
+    finally:
+        for path in (video_only, audio_only):
+            if os.path.exists(path):
+                os.remove(path)
+    return output_path
@@ -5,6 +5,7 @@ import subprocess
 import time
 import gc
 from moviepy import VideoFileClip, CompositeVideoClip, ColorClip
+from videoRender import write_pipelined, write_with_audio_passthrough
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
@@ -77,12 +78,13 @@ def get_authenticated_service(token_path, scopes, client_secrets):
     return build("youtube", "v3", credentials=creds)
 
 
-def ensure_vertical_video(input_path, output_path, target_aspect_ratio=9/16):
+def ensure_vertical_video(input_path, output_path, target_aspect_ratio=9/16, audio_passthrough=True,
+                          pipelined=True):
     """Convert video to vertical 9:16 format with top and bottom bars."""
-    clip = VideoFileClip(input_path)
     if os.path.exists(output_path):
         print(f"Vertical video already exists at {output_path}, skipping conversion.")
         return output_path
+    clip = VideoFileClip(input_path)
     width, height = clip.size
     current_aspect_ratio = width / height
 
@@ -103,7 +105,14 @@ def ensure_vertical_video(input_path, output_path, target_aspect_ratio=9/16):
     video_with_position = resized_clip.with_position((x_center, y_offset))
     background = ColorClip(size=(target_width, target_height), color=(0, 0, 0), duration=clip.duration)
     final = CompositeVideoClip([background, video_with_position])
-    final.write_videofile(output_path, codec="libx264", audio_codec="aac", threads=4, preset="ultrafast")
+    if audio_passthrough:
+        # Only the picture changes, so stream-copy the original audio
+        write_with_audio_passthrough(final, output_path, input_path, pipelined=pipelined,
+                                     codec="libx264", threads=4, preset="ultrafast")
+    elif pipelined:
+        write_pipelined(final, output_path, codec="libx264", threads=4, preset="ultrafast")
+    else:
+        final.write_videofile(output_path, codec="libx264", audio_codec="aac", threads=4, preset="ultrafast")
     clip.close()
 
     cleanup_clip(final)   # close the CompositeVideoClip you just wrote